@@ -0,0 +1,61 @@
+import random
+import time
+from array import array
+
+from utils.basket_optimizer import optimize_basket
+from utils.matching import ladder_segments
+from utils.order_book import Ladder
+
+ITEMS = 5000
+DEPTH = 30
+CARGO = 10000
+BUDGET = 100000000
+TIME_SLACK = 0.05  # Sekunden Toleranz für Scheduler und Messung
+
+
+def _ladder(prices, volumes, first_order_id):
+    return Ladder(array("d", prices), array("q", volumes),
+                  array("q", range(first_order_id, first_order_id + len(prices))))
+
+
+def _items(seed=1):
+    # Viele Items mit tiefen, knapp profitablen Leitern
+    rng = random.Random(seed)
+    items = []
+    for type_id in range(ITEMS):
+        price = rng.uniform(10, 100000)
+        sell = sorted(price * rng.uniform(0.9, 1.05) for _ in range(DEPTH))
+        buy = sorted((price * rng.uniform(0.95, 1.1) for _ in range(DEPTH)), reverse=True)
+        items.append((type_id,
+                      _ladder(sell, [rng.randint(1, 500) for _ in sell], type_id * 2 * DEPTH),
+                      _ladder(buy, [rng.randint(1, 500) for _ in buy], (type_id * 2 + 1) * DEPTH),
+                      rng.uniform(0.01, 50)))
+    return items
+
+
+def test_optimize_basket_returns_within_time_budget():
+    items = _items()
+    for time_budget in (0.1, 0.3):
+        started = time.perf_counter()
+        basket = optimize_basket(items, CARGO, BUDGET, time_budget=time_budget)
+        assert time.perf_counter() - started <= time_budget + TIME_SLACK
+        assert basket["items"]
+        assert basket["m3_used"] <= CARGO * (1 + 1e-9) and basket["isk_spent"] <= BUDGET * (1 + 1e-9)
+
+
+def test_dominant_item_survives_truncation():
+    # Steht das mit Abstand beste Item ganz hinten, darf der Zeitabbruch es nicht verdrängen
+    items = _items()
+    items.append(("dominant", _ladder([100.0], [1000], 1), _ladder([1000000.0], [1000], 2), 0.01))
+    basket = optimize_basket(items, CARGO, BUDGET, time_budget=0.02)
+    assert basket["items"][0]["key"] == "dominant"
+    assert basket["items"][0]["units"] == 1000
+
+
+def test_ladder_segments_max_units_is_prefix():
+    sell, buy, _ = _items()[0][1:]
+    lengths, sell_at, buy_at = ladder_segments(sell, buy)
+    capped, capped_sell, capped_buy = ladder_segments(sell, buy, max_units=sum(lengths) // 2)
+    assert sum(capped) == sum(lengths) // 2
+    assert capped_sell == sell_at[:len(capped)] and capped_buy == buy_at[:len(capped)]
+    assert capped[:-1] == lengths[:len(capped) - 1]
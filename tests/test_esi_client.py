@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from utils import metrics
+from utils.esi_client import ERROR_LIMIT_THRESHOLD, EsiClient
+
+REGION = 10000002
+
+
+class StubEsiHandler(BaseHTTPRequestHandler):
+    # Antwortet mit vorbereiteten Antworten je (Region, Seite); solange mehrere vorliegen, wird
+    # die erste verbraucht, die letzte gilt für alle weiteren Anfragen.
+    def do_GET(self):
+        url = urlparse(self.path)
+        region_id = int(url.path.split("/")[2])
+        page = int(parse_qs(url.query)["page"][0])
+        self.server.hits.append((region_id, page, self.headers.get("If-None-Match"), time.monotonic()))
+
+        responses = self.server.responses[(region_id, page)]
+        status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+        time.sleep(headers.get("delay", 0))
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in headers.items():
+            if name != "delay":
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def esi():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEsiHandler)
+    server.responses = {}
+    server.hits = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    metrics.reset()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _orders(page, count=2):
+    return [{"order_id": page * 100 + k} for k in range(count)]
+
+
+def _page(page, pages, etag=None, **headers):
+    headers = {"X-Pages": str(pages), **headers}
+    if etag:
+        headers["ETag"] = etag
+    return 200, headers, _orders(page)
+
+
+def _counter(name):
+    return sum(c["value"] for c in metrics.snapshot()["counters"] if c["name"] == name)
+
+
+def _hits(esi, page):
+    return [hit for hit in esi.hits if hit[1] == page]
+
+
+def test_pages_are_assembled_in_page_order(esi):
+    # Seite 2 kommt als letzte an und steht trotzdem an zweiter Stelle
+    esi.responses[(REGION, 1)] = [_page(1, 3)]
+    esi.responses[(REGION, 2)] = [(200, {"X-Pages": "3", "delay": 0.2}, _orders(2))]
+    esi.responses[(REGION, 3)] = [_page(3, 3)]
+
+    with EsiClient(base_url=esi.url, max_workers=3) as client:
+        pages = client.fetch_regions([REGION])[REGION]
+        orders = client.fetch_region_orders(REGION)
+
+    assert [p["page"] for p in pages] == [1, 2, 3]
+    assert [o["order_id"] for o in orders] == [100, 101, 200, 201, 300, 301]
+
+
+def test_server_errors_are_retried(esi):
+    esi.responses[(REGION, 1)] = [(503, {}, None), (502, {}, None), _page(1, 1)]
+
+    with EsiClient(base_url=esi.url, max_workers=1, backoff_base=0.0) as client:
+        pages = client.fetch_regions([REGION])[REGION]
+
+    assert pages[0]["status"] == 200
+    assert len(_hits(esi, 1)) == 3
+    assert _counter("esi_retries") == 2
+
+
+def test_unexpected_304_is_refetched_without_etag(esi):
+    # Zu Seite 2 gibt es keinen alten Stand, ihr 304 darf die Seite nicht leer lassen
+    esi.responses[(REGION, 1)] = [(304, {"X-Pages": "2", "ETag": '"p1"'}, None)]
+    esi.responses[(REGION, 2)] = [(304, {"X-Pages": "2"}, None), _page(2, 2, etag='"p2"')]
+
+    with EsiClient(base_url=esi.url, max_workers=1) as client:
+        pages = client.fetch_regions([REGION], etags={REGION: {1: '"p1"'}})[REGION]
+
+    assert [(p["page"], p["status"]) for p in pages] == [(1, 304), (2, 200)]
+    assert pages[1]["data"] == _orders(2)
+    assert [hit[2] for hit in _hits(esi, 2)] == [None, None]
+    assert _counter("esi_unexpected_304") == 1
+
+
+def test_error_limit_pauses_until_reset(esi):
+    # Kurz vor dem Fehlerlimit wartet der Client bis zum Reset (+1s), bevor er weiter anfragt
+    esi.responses[(REGION, 1)] = [_page(1, 2, **{"X-ESI-Error-Limit-Remain": str(ERROR_LIMIT_THRESHOLD),
+                                                 "X-ESI-Error-Limit-Reset": "0"})]
+    esi.responses[(REGION, 2)] = [_page(2, 2)]
+
+    with EsiClient(base_url=esi.url, max_workers=1) as client:
+        pages = client.fetch_regions([REGION])[REGION]
+
+    assert [p["page"] for p in pages] == [1, 2]
+    assert _hits(esi, 2)[0][3] - _hits(esi, 1)[0][3] >= 1.0
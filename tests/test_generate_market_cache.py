@@ -0,0 +1,47 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils import generate_market_cache
+from utils.generate_market_cache import load_cache_meta, refresh_regions
+from utils.order_store import load_orders
+
+EMPTY_REGION = 10000003
+
+
+class EmptyRegionHandler(BaseHTTPRequestHandler):
+    # Leere Region: X-Pages: 0 und genau eine leere Seite
+    def do_GET(self):
+        body = b"[]"
+        self.send_response(200)
+        self.send_header("X-Pages", "0")
+        self.send_header("ETag", '"empty"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def esi_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EmptyRegionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_refresh_empty_region_leaves_no_spill_directory(esi_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_market_cache, "CACHE_DIR", str(tmp_path))
+
+    refreshed = refresh_regions([EMPTY_REGION], base_url=esi_url, max_workers=1)
+
+    assert refreshed == [EMPTY_REGION]
+    meta = load_cache_meta(EMPTY_REGION)
+    assert len(load_orders(os.path.join(tmp_path, meta["snapshot"]))) == 0
+    assert [name for name in os.listdir(tmp_path) if os.path.isdir(os.path.join(tmp_path, name))] == []
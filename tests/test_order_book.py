@@ -0,0 +1,78 @@
+import random
+
+from utils.order_book import apply_diff, build_order_book, build_station_index
+from utils.order_diff import diff_snapshots
+from utils.order_store import OrderTable, empty_columns
+from utils.synthetic_data import FIRST_REGION_ID, make_orders, make_stations, make_universe
+
+TYPES = 40
+
+
+def _table(columns):
+    return OrderTable(columns, len(columns["order_id"]))
+
+
+def _snapshots(seed=7):
+    # Alter Snapshot und ein neuer mit geänderten, gelöschten und neuen Orders
+    universe = make_universe(systems=60, regions=3, gates=90, seed=seed)
+    station_data = make_stations(universe, seed=seed)
+    old = make_orders(FIRST_REGION_ID, station_data, types=TYPES, orders=3000, seed=seed)
+    rng = random.Random(seed)
+
+    new = empty_columns()
+    removed_type = old["type_id"][0]
+    for i in range(len(old["order_id"])):
+        if old["type_id"][i] == removed_type or rng.random() < 0.1:
+            continue
+        for name, column in new.items():
+            column.append(old[name][i])
+        if rng.random() < 0.1:
+            new["price"][-1] = round(new["price"][-1] * rng.uniform(0.9, 1.1), 2)
+        if rng.random() < 0.1:
+            new["volume_remain"][-1] = rng.randint(1, 5000)
+
+    added = make_orders(FIRST_REGION_ID, station_data, types=TYPES + 5, orders=400, seed=seed + 1,
+                        first_order_id=max(old["order_id"]) + 1)
+    for name, column in new.items():
+        column.extend(added[name])
+    return build_station_index(station_data), _table(old), _table(new)
+
+
+def _entries(book):
+    # Leitern als sortierte Orderlisten, damit gleiche Preise in beliebiger Reihenfolge stehen dürfen
+    return {
+        (system_id, type_id, side): sorted(zip(ladder.order_ids, ladder.prices, ladder.volumes))
+        for system_id, types in book.items()
+        for type_id, sides in types.items()
+        for side, ladder in sides.items()
+    }
+
+
+def test_apply_diff_matches_rebuild():
+    station_index, old_table, new_table = _snapshots()
+    book = build_order_book(old_table, station_index)
+    updated, affected = apply_diff(book, old_table, new_table, diff_snapshots(old_table, new_table), station_index)
+
+    assert affected
+    assert _entries(updated) == _entries(build_order_book(new_table, station_index))
+    for types in updated.values():
+        for sides in types.values():
+            assert list(sides["sell"].prices) == sorted(sides["sell"].prices)
+            assert list(sides["buy"].prices) == sorted(sides["buy"].prices, reverse=True)
+
+
+def test_apply_diff_leaves_old_book_untouched():
+    station_index, old_table, new_table = _snapshots()
+    book = build_order_book(old_table, station_index)
+    before = _entries(book)
+    systems = {system_id: dict(types) for system_id, types in book.items()}
+
+    updated, affected = apply_diff(book, old_table, new_table, diff_snapshots(old_table, new_table), station_index)
+
+    assert _entries(book) == before
+    assert {system_id: dict(types) for system_id, types in book.items()} == systems
+    # Unveränderte Leitern werden geteilt, nicht kopiert
+    for system_id, types in updated.items():
+        for type_id, sides in types.items():
+            if (system_id, type_id) not in affected:
+                assert sides is book[system_id][type_id]
@@ -0,0 +1,140 @@
+import argparse
+import time
+from collections import namedtuple
+
+from utils import metrics, static_data
+from utils.generate_market_cache import get_market_orders
+from utils.jump_distances import load_distance_table
+from utils.static_data import UNIVERSE_PATH
+
+THE_FORGE = 10000002
+SCAN_DEPTH = 8  # günstigste Ask- bzw. höchste Bid-Stationen pro Typ, die gepaart werden
+DEFAULT_LIMIT = 20
+
+# Bester Preis einer Station für einen Typ, mit dem Volumen, das zu diesem Preis verfügbar ist
+Quote = namedtuple("Quote", ["price", "volume", "station_id"])
+
+
+def neighbouring_regions(route_graph, region_id):
+    # Regionen, die über mindestens ein Stargate an `region_id` grenzen
+    regions = route_graph.regions
+    offsets = route_graph.offsets
+    neighbors = route_graph.neighbors
+    found = set()
+    for i in range(len(route_graph)):
+        if regions[i] != region_id:
+            continue
+        for k in range(offsets[i], offsets[i + 1]):
+            other = regions[neighbors[k]]
+            if other != region_id:
+                found.add(other)
+    return sorted(found)
+
+
+def aggregate_quotes(table, asks, bids):
+    # Ein Durchlauf über die Spalten: pro (Typ, Station) bester Ask und bester Bid.
+    # asks/bids: {type_id: {station_id: [price, volume]}}, werden über Regionen hinweg ergänzt.
+    if not len(table):
+        return
+    for type_id, location_id, price, volume, is_buy in zip(
+            table["type_id"], table["location_id"], table["price"], table["volume_remain"], table["is_buy_order"]):
+        stations = (bids if is_buy else asks).setdefault(type_id, {})
+        best = stations.get(location_id)
+        if best is None or (price > best[0] if is_buy else price < best[0]):
+            stations[location_id] = [price, volume]
+        elif price == best[0]:
+            best[1] += volume
+
+
+def _top_quotes(stations, descending):
+    ranked = sorted(stations.items(), key=lambda entry: entry[1][0], reverse=descending)[:SCAN_DEPTH]
+    return [Quote(price, volume, station_id) for station_id, (price, volume) in ranked]
+
+
+def find_spreads(asks, bids, station_index, distance_table, item_table, cargo_capacity, budget):
+    # Verbindet die besten Asks und Bids jedes Typs mit der Sprungdistanz zwischen den Stationen
+    route_graph = distance_table.route_graph
+    spreads = []
+    for type_id, ask_stations in asks.items():
+        bid_stations = bids.get(type_id)
+        if not bid_stations or type_id not in item_table:
+            continue
+        top_asks = _top_quotes(ask_stations, descending=False)
+        top_bids = _top_quotes(bid_stations, descending=True)
+        if top_asks[0].price >= top_bids[0].price:
+            continue
+
+        volume_per_unit = item_table.volume(type_id)
+        max_units = cargo_capacity // volume_per_unit if volume_per_unit > 0 else float("inf")
+        for ask in top_asks:
+            from_system = station_index.get(ask.station_id)
+            if from_system is None:
+                continue
+            affordable = min(max_units, budget // ask.price)
+            for bid in top_bids:
+                if bid.price <= ask.price:
+                    break
+                to_system = station_index.get(bid.station_id)
+                if to_system is None:
+                    continue
+                jumps = distance_table.distance(from_system, to_system)
+                if jumps is None:
+                    continue
+                units = int(min(ask.volume, bid.volume, affordable))
+                if units <= 0:
+                    continue
+                profit = units * (bid.price - ask.price)
+                spreads.append({
+                    "item_id": str(type_id),
+                    "name": item_table.name(type_id),
+                    "from_station": ask.station_id,
+                    "to_station": bid.station_id,
+                    "from": route_graph.names[route_graph.index_of[from_system]],
+                    "to": route_graph.names[route_graph.index_of[to_system]],
+                    "buy_price": ask.price,
+                    "sell_price": bid.price,
+                    "units": units,
+                    "total_profit": profit,
+                    "jumps": jumps,
+                    "profit_per_jump": profit / max(jumps, 1)
+                })
+    spreads.sort(key=lambda x: x["profit_per_jump"], reverse=True)
+    return spreads
+
+
+def scan_regions(region_ids, station_index, item_table, cargo_capacity, budget, universe_path=UNIVERSE_PATH,
+                 mode="highsec", limit=DEFAULT_LIMIT, refresh=True, distance_table=None):
+    # distance_table: bereits geladene Tabelle für `mode` (z.B. vom Trade-Server), sonst wird sie hier geladen
+    distance_table = distance_table or load_distance_table(universe_path, mode)
+    asks, bids = {}, {}
+    started = time.time()
+    orders = 0
+    with metrics.timer("arbitrage_scan"):
+        for region_id in region_ids:
+            table = get_market_orders(region_id, order_type="all", refresh=refresh)
+            orders += len(table)
+            aggregate_quotes(table, asks, bids)
+
+        spreads = find_spreads(asks, bids, station_index, distance_table, item_table, cargo_capacity, budget)
+    metrics.say(f"🔎 {orders} Orders in {len(region_ids)} Regionen, {len(spreads)} Spreads in {time.time() - started:.1f}s")
+    return spreads[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Station-zu-Station-Arbitrage über ganze Regionen")
+    parser.add_argument("regions", nargs="*", type=int, help="Region-IDs (Standard: The Forge und Nachbarregionen)")
+    parser.add_argument("--mode", default="highsec", help="Sicherheitsmodus der Sprungdistanzen")
+    parser.add_argument("--cargo", type=float, default=10000)
+    parser.add_argument("--budget", type=float, default=100000000)
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--no-refresh", action="store_true", help="Vorhandene Snapshots ohne Aktualisierung verwenden")
+    args = parser.parse_args()
+
+    region_ids = args.regions or [THE_FORGE] + neighbouring_regions(static_data.route_graph(), THE_FORGE)
+    results = scan_regions(
+        region_ids, static_data.station_index(), static_data.item_table(),
+        args.cargo, args.budget, mode=args.mode, limit=args.limit, refresh=not args.no_refresh
+    )
+    for entry in results:
+        print(f"{entry['name']:35} | {entry['from']} → {entry['to']} ({entry['jumps']} Sprünge) | "
+              f"Gewinn: {entry['total_profit']:,.2f} ISK | pro Sprung: {entry['profit_per_jump']:,.2f} ISK")
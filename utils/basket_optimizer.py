@@ -0,0 +1,296 @@
+import time
+from math import ceil, floor
+
+from utils.matching import ladder_segments, upper_bound
+
+TIME_BUDGET = 1.0  # Sekunden für die gesamte Optimierung
+SEGMENT_SHARE = 0.3  # Anteil des Zeitbudgets für das Zerlegen der Leitern, der Rest bleibt für Greedy, Schranke und DP
+MAX_BLOCKS = 256  # Blöcke mit dem besten Verhältnis, die in die DP gehen
+DP_BUCKETS = 500  # Auflösung der exakt behandelten Ressource (Frachtraum oder Budget) in der DP
+LIMIT_TOLERANCE = 1e-9  # relative Rundungsreserve beim Prüfen der Grenzen
+LAMBDA_STEPS = 16  # Bisektionsschritte für den ISK-Preis λ
+
+# Ein Segment ist ein Stück Preisleiter mit konstantem Kauf- und Verkaufspreis:
+# (item, start, end, unit_cost, unit_profit, unit_volume), start/end in Einheiten des Items
+COST, PROFIT, VOLUME = 3, 4, 5
+
+
+def rank_items(items, cargo_capacity, budget):
+    # Items absteigend nach der günstigen Gewinnschranke, Items ohne möglichen Gewinn fallen weg.
+    # Bricht build_segments ab, fehlen so nur die Items mit den kleinsten Schranken.
+    bounds = [upper_bound(sell, buy, volume_per_unit, cargo_capacity, budget)
+              for _, sell, buy, volume_per_unit in items]
+    order = sorted((k for k, bound in enumerate(bounds) if bound > 0), key=lambda k: -bounds[k])
+    return [items[k] for k in order]
+
+
+def _max_units(sell, volume_per_unit, cargo_capacity, budget):
+    # Mehr Einheiten passen weder ins Budget (jede kostet mindestens den besten Ask) noch in den Frachtraum
+    units = budget // sell.prices[0] if sell.prices else 0
+    if volume_per_unit > 0:
+        units = min(units, cargo_capacity // volume_per_unit)
+    return units
+
+
+def build_segments(items, deadline=None, cargo_capacity=None, budget=None):
+    # items: Folge von (key, sell_ladder, buy_ladder, volume_per_unit). Mit `deadline` wird
+    # bei Zeitüberschreitung abgebrochen, es fehlen dann die Segmente der restlichen Items;
+    # das erste Item wird immer zerlegt. Mit Frachtraum und Budget endet jede Leiter bei der
+    # Stückzahl, die sich überhaupt kaufen lässt.
+    segments = []
+    for item, (_, sell, buy, volume_per_unit) in enumerate(items):
+        if item and deadline is not None and time.monotonic() > deadline:
+            break
+        max_units = None
+        if cargo_capacity is not None and budget is not None:
+            max_units = _max_units(sell, volume_per_unit, cargo_capacity, budget)
+        lengths, sell_at, buy_at = ladder_segments(sell, buy, max_units)
+        start = 0
+        for length, cost, price in zip(lengths, sell_at, buy_at):
+            segments.append((item, start, start + length, cost, price - cost, volume_per_unit))
+            start += length
+    return segments
+
+
+def _ratio(segment, cargo_weight, budget_weight):
+    # Gewinn pro Einheit im Verhältnis zum gewichteten Anteil an Frachtraum und Budget
+    _, _, _, cost, profit, volume = segment
+    usage = volume * cargo_weight + cost * budget_weight
+    return profit / usage if usage > 0 else float("inf")
+
+
+def _fractional_bound(segments, weight, capacity):
+    # LP-Schranke mit nur einer Ressource; Segmente ohne Gewicht zählen komplett
+    bound = 0.0
+    weighted = []
+    for segment in segments:
+        units = segment[2] - segment[1]
+        w = weight(segment)
+        if w <= 0:
+            bound += units * segment[4]
+        else:
+            weighted.append((segment[4] / w, units, w))
+    weighted.sort(reverse=True)
+    for ratio, units, w in weighted:
+        if capacity <= 0:
+            break
+        take = min(units, capacity / w)
+        bound += take * ratio * w
+        capacity -= take * w
+    return bound
+
+
+def segment_bound(segments, cargo_capacity, budget):
+    # Minimum der beiden Einzelschranken (nur Frachtraum, nur Budget)
+    return min(
+        _fractional_bound(segments, lambda s: s[5], cargo_capacity),
+        _fractional_bound(segments, lambda s: s[3], budget)
+    )
+
+
+def _greedy_fill(segments, order, units, cargo_left, budget_left):
+    # Füllt Restkapazität in der Reihenfolge `order`; Segmente eines Items werden nur
+    # lückenlos von vorne genommen, `units` (pro Item) wird dabei angepasst.
+    for k in order:
+        item, start, end, cost, _, volume = segments[k]
+        taken = units[item]
+        if taken < start or taken >= end:
+            continue
+        take = end - taken
+        if volume > 0:
+            take = min(take, floor(cargo_left / volume))
+        take = min(take, floor(budget_left / cost))
+        if take <= 0:
+            continue
+        units[item] = taken + take
+        cargo_left -= take * volume
+        budget_left -= take * cost
+    return units
+
+
+def _evaluate_item(segments, item_segments, taken):
+    # Gewinn, Kosten und Volumen von `taken` Einheiten eines Items, von der günstigsten Order an
+    cost = profit = m3 = 0.0
+    for k in item_segments:
+        _, start, end, unit_cost, unit_profit, volume = segments[k]
+        if start >= taken:
+            break
+        n = min(end, taken) - start
+        cost += n * unit_cost
+        profit += n * unit_profit
+        m3 += n * volume
+    return profit, cost, m3
+
+
+def _evaluate(segments, by_item, units):
+    # Tatsächliche Kosten/Gewinne eines Korbs
+    cost = profit = m3 = 0.0
+    for item, taken in enumerate(units):
+        if taken:
+            item_profit, item_cost, item_m3 = _evaluate_item(segments, by_item[item], taken)
+            profit += item_profit
+            cost += item_cost
+            m3 += item_m3
+    return profit, cost, m3
+
+
+def _within_limits(cost, m3, cargo_capacity, budget):
+    return m3 <= cargo_capacity * (1 + LIMIT_TOLERANCE) and cost <= budget * (1 + LIMIT_TOLERANCE)
+
+
+def _blocks(segments, order, limit):
+    # Binärzerlegung (1, 2, 4, ..., Rest) der besten Segmente für die 0/1-DP
+    blocks = []
+    for k in order:
+        item, start, end, _, _, _ = segments[k]
+        remaining = end - start
+        size = 1
+        while remaining > 0:
+            n = min(size, remaining)
+            blocks.append((k, n))
+            remaining -= n
+            size *= 2
+        if len(blocks) >= limit:
+            break
+    return blocks
+
+
+def _knapsack(segments, blocks, weights, values, buckets, deadline):
+    # 0/1-Rucksack über `buckets` Kapazitätsstufen, Rekonstruktion über die Auswahltabelle.
+    # Gibt die gewählten Einheiten pro Segment zurück oder None bei Zeitüberschreitung.
+    dp = [0.0] * (buckets + 1)
+    keep = []
+    for w, value in zip(weights, values):
+        if time.monotonic() > deadline:
+            return None
+        if value <= 0 or w > buckets:
+            keep.append(None)
+            continue
+        if w == 0:
+            dp = [x + value for x in dp]
+            keep.append(b"\x01" * (buckets + 1))
+            continue
+        shifted = [y + value for y in dp[:buckets + 1 - w]]
+        head = dp[w:]
+        keep.append(b"\x00" * w + bytes(y > x for x, y in zip(head, shifted)))
+        dp = dp[:w] + [y if y > x else x for x, y in zip(head, shifted)]
+
+    capacity = max(range(buckets + 1), key=dp.__getitem__)
+    chosen = {}
+    for (k, n), w, row in zip(reversed(blocks), reversed(weights), reversed(keep)):
+        if row is not None and row[capacity]:
+            chosen[k] = chosen.get(k, 0) + n
+            capacity -= w
+    return chosen
+
+
+def _dp_solution(segments, by_item, n_items, order, limits, primary, deadline):
+    # Lagrange-Relaxation: die knappere Ressource `primary` (COST oder VOLUME) exakt über
+    # aufgerundete Buckets, die andere über einen Preis λ, der per Bisektion so gewählt
+    # wird, dass der Korb sie gerade noch einhält.
+    blocks = _blocks(segments, order, MAX_BLOCKS)
+    if not blocks:
+        return None
+    secondary = COST if primary == VOLUME else VOLUME
+    bucket_size = limits[primary] / DP_BUCKETS
+    weights = [ceil(segments[k][primary] * n / bucket_size - 1e-9) for k, n in blocks]
+
+    def solve(lam):
+        values = [n * (segments[k][PROFIT] - lam * segments[k][secondary]) for k, n in blocks]
+        chosen = _knapsack(segments, blocks, weights, values, DP_BUCKETS, deadline)
+        if chosen is None:
+            return None
+        units = [0] * n_items
+        for k, n in chosen.items():
+            units[segments[k][0]] += n
+        profit, cost, m3 = _evaluate(segments, by_item, units)
+        return units, profit, cost if secondary == COST else m3
+
+    best = None
+    lo = 0.0
+    hi = max((segments[k][PROFIT] / segments[k][secondary] for k, _ in blocks if segments[k][secondary] > 0),
+             default=0.0)
+    lam = lo
+    for _ in range(LAMBDA_STEPS + 1):
+        result = solve(lam)
+        if result is None:
+            break
+        units, profit, used = result
+        if used <= limits[secondary]:
+            if best is None or profit > best[1]:
+                best = (units, profit)
+            if lam == 0.0:
+                break
+            hi = lam
+        else:
+            lo = lam
+        lam = (lo + hi) / 2
+    return best and best[0]
+
+
+def optimize_basket(items, cargo_capacity, budget, time_budget=TIME_BUDGET):
+    # Gemeinsamer Warenkorb über alle Items mit geteiltem Frachtraum und Budget.
+    # items: Folge von (key, sell_ladder, buy_ladder, volume_per_unit). Die Items werden nach
+    # ihrer Schranke sortiert und nur während SEGMENT_SHARE des Zeitbudgets zerlegt, damit der
+    # erste Greedy-Korb und die Schranke über die erfassten Segmente noch in time_budget passen.
+    started = time.monotonic()
+    deadline = started + time_budget
+    items = rank_items(list(items), cargo_capacity, budget)
+    segments = build_segments(items, started + time_budget * SEGMENT_SHARE, cargo_capacity, budget)
+    result = {"items": [], "total_profit": 0.0, "isk_spent": 0.0, "m3_used": 0.0, "upper_bound": 0.0,
+              "method": "greedy"}
+    if not segments or cargo_capacity <= 0 or budget <= 0:
+        return result
+
+    by_item = [[] for _ in items]
+    for k, segment in enumerate(segments):
+        by_item[segment[0]].append(k)
+    limits = {COST: budget, VOLUME: cargo_capacity}
+    result["upper_bound"] = segment_bound(segments, cargo_capacity, budget)
+
+    # Greedy nach drei Verhältnissen: beide Ressourcen, nur Frachtraum, nur Budget. Innerhalb
+    # eines Items fällt jedes dieser Verhältnisse nie, die Auswahl bleibt also lückenlos.
+    # Ein weiterer Durchlauf startet nur, wenn er so lange wie der erste noch vor der Deadline fertig wird.
+    best_order = units = None
+    profit = -1.0
+    pass_time = 0.0
+    for weighting in ((1 / cargo_capacity, 1 / budget), (1.0, 0.0), (0.0, 1.0)):
+        pass_started = time.monotonic()
+        if best_order is not None and pass_started + pass_time > deadline:
+            break
+        order = sorted(range(len(segments)), key=lambda k: (-_ratio(segments[k], *weighting), k))
+        candidate = _greedy_fill(segments, order, [0] * len(items), cargo_capacity, budget)
+        candidate_profit, cost, m3 = _evaluate(segments, by_item, candidate)
+        if candidate_profit > profit:
+            best_order, units, profit = order, candidate, candidate_profit
+            primary = VOLUME if m3 / cargo_capacity >= cost / budget else COST
+        pass_time = max(pass_time, time.monotonic() - pass_started)
+
+    # Die DP endet so früh, dass das Auffüllen danach (ein Greedy-Durchlauf) noch vor der Deadline liegt
+    if profit < result["upper_bound"] * (1 - 1e-9) and time.monotonic() + pass_time <= deadline:
+        dp_units = _dp_solution(segments, by_item, len(items), best_order, limits, primary, deadline - pass_time)
+        if dp_units is not None:
+            _, dp_cost, dp_m3 = _evaluate(segments, by_item, dp_units)
+            dp_units = _greedy_fill(segments, best_order, dp_units, cargo_capacity - dp_m3, budget - dp_cost)
+            dp_profit, dp_cost, dp_m3 = _evaluate(segments, by_item, dp_units)
+            # Die Buckets runden nur die exakt behandelte Ressource sicher auf, daher beide prüfen
+            if dp_profit > profit and _within_limits(dp_cost, dp_m3, cargo_capacity, budget):
+                units, profit = dp_units, dp_profit
+                result["method"] = "dp"
+
+    for item, taken in enumerate(units):
+        if not taken:
+            continue
+        item_profit, item_cost, item_m3 = _evaluate_item(segments, by_item[item], taken)
+        result["items"].append({
+            "key": items[item][0],
+            "units": taken,
+            "profit": item_profit,
+            "isk_spent": item_cost,
+            "m3_used": item_m3
+        })
+        result["total_profit"] += item_profit
+        result["isk_spent"] += item_cost
+        result["m3_used"] += item_m3
+    result["items"].sort(key=lambda x: x["profit"], reverse=True)
+    return result
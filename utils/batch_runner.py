@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import metrics
+from utils.trade_server import TradeState, UNIVERSE_PATH, DEFAULT_CARGO, DEFAULT_BUDGET, DEFAULT_LIMIT
+
+CHUNKSIZE = 8
+
+# Pro Prozess einmal geladen; bei fork erben die Worker den bereits geladenen Zustand
+_state = None
+
+
+def _init_worker(universe_path):
+    global _state
+    if _state is None:
+        _state = TradeState(universe_path, scan_modes=())
+
+
+def _query_error(query):
+    # Form der Abfrage vorab prüfen; gibt eine Fehlermeldung zurück oder None
+    if not isinstance(query, dict):
+        return f"Abfrage ist kein JSON-Objekt: {type(query).__name__}"
+    if "invalid" in query:
+        return "Ungültige JSON-Zeile"
+    for key in ("source", "destination"):
+        if not isinstance(query.get(key), str):
+            return f"{key} fehlt oder ist kein Systemname"
+    return None
+
+
+def run_query(query):
+    error = _query_error(query)
+    if error is not None:
+        metrics.inc("batch_errors")
+        return {"query": query, "error": error}
+    metrics.inc("batch_queries")
+    try:
+        result = _state.trade(
+            query["source"], query["destination"],
+            cargo_capacity=float(query.get("cargo_capacity", DEFAULT_CARGO)),
+            budget=float(query.get("budget", DEFAULT_BUDGET)),
+            policy=query.get("policy", "highsec"),
+            limit=int(query.get("limit", DEFAULT_LIMIT)),
+            multi_hop=bool(query.get("multi_hop", False)),
+            basket=bool(query.get("basket", False)),
+            metric=query.get("metric", "total_profit")
+        )
+    except Exception as e:
+        # Eine fehlerhafte Abfrage (z.B. "cargo_capacity": null oder eine kaputte Policy)
+        # wird als Fehler-Ergebnis gezählt und bricht nicht den ganzen Lauf ab
+        metrics.inc("batch_errors")
+        return {"query": query, "error": f"{type(e).__name__}: {e}"}
+    return {"query": query, **result}
+
+
+def read_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield {"line": line_no, "invalid": line}
+
+
+def run_batch(queries_path, results_path, workers=None, universe_path=UNIVERSE_PATH, refresh=True):
+    global _state
+    _state = TradeState(universe_path, scan_modes=())
+    if refresh:
+        _state.refresh_due_regions()
+    _state.warm_up()
+
+    queries = list(read_queries(queries_path))
+    workers = workers or os.cpu_count() or 1
+    print(f"📋 {len(queries)} Szenarien, {workers} Worker")
+
+    started = time.perf_counter()
+    errors = 0
+    with open(results_path, "w", encoding="utf-8") as out:
+        if workers == 1:
+            results = map(run_query, queries)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(universe_path,))
+            results = executor.map(run_query, queries, chunksize=CHUNKSIZE)
+        try:
+            for result in results:
+                if "error" in result:
+                    errors += 1
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    duration = time.perf_counter() - started
+    metrics.observe("batch_run", duration, workers=workers)
+    print(f"✅ {len(queries)} Szenarien in {duration:.1f}s ausgewertet ({errors} Fehler) → {results_path}")
+    return len(queries), errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Viele Handelsszenarien aus einer JSONL-Datei auswerten")
+    parser.add_argument("queries", help="JSONL mit source, destination, cargo_capacity, budget, policy")
+    parser.add_argument("results", help="Ausgabedatei (JSONL)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-refresh", action="store_true", help="Marktdaten vorher nicht aktualisieren")
+    parser.add_argument("--quiet", action="store_true", help="Fortschrittsmeldungen unterdrücken")
+    parser.add_argument("--metrics", help="Metriken nach dem Lauf schreiben (.prom = Prometheus, sonst JSON)")
+    parser.add_argument("--profile", choices=metrics.PROFILE_MODES, help="Lauf mit cProfile oder tracemalloc")
+    parser.add_argument("--profile-output", help="Profilierungsergebnis in diese Datei schreiben")
+    args = parser.parse_args()
+    if args.quiet:
+        metrics.set_quiet()
+    with metrics.profiling(args.profile, args.profile_output):
+        run_batch(args.queries, args.results, workers=args.workers, refresh=not args.no_refresh)
+    if args.metrics:
+        # Bei mehreren Workern enthalten die Zähler nur den Elternprozess (Laden, Aufwärmen, Gesamtzeit)
+        metrics.write_metrics(args.metrics)
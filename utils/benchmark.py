@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from utils.generate_universe_cache import resolve_stargate_links
+from utils.lookup_tables import ItemTable
+from utils.matching import match_ladders
+from utils.order_book import build_order_book, build_station_index, get_order_book
+from utils.order_store import load_orders
+from utils.parallel_analysis import analyze_route_parallel, available_workers
+from utils.routing import RouteGraph, build_graph, find_shortest_path
+from utils.synthetic_data import (
+    FIRST_REGION_ID,
+    make_items,
+    make_orders,
+    make_stargates,
+    make_stations,
+    make_universe,
+    write_workspace
+)
+from utils.trade_analysis import analyze_route_trade_opportunities, build_market_data, evaluate_market
+from utils.universe_index import build_universe_index
+
+CARGO = 10000
+BUDGET = 100000000
+ROUTE_PAIRS = 200
+LONG_ROUTE_STOPS = 30  # ~435 Paare wie bei einer 30-Sprung-Route
+TOP_K = 10
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_call(func, repeat, setup=None):
+    # Bestwert zählt; setup() liefert ungemessen die Argumente für func,
+    # Ausgaben der gemessenen Funktionen werden verschluckt
+    runs = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            func(*args)
+            runs.append(time.perf_counter() - started)
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def _busiest_systems(book, count):
+    return sorted(book, key=lambda system_id: len(book[system_id]), reverse=True)[:count]
+
+
+def run_benchmarks(systems=5000, regions=60, gates=7000, orders=400000, types=5000, seed=42, repeat=3):
+    params = {"systems": systems, "regions": regions, "gates": gates, "orders": orders, "types": types,
+              "seed": seed, "repeat": repeat}
+    results = {}
+    print(f"🧪 Erzeuge synthetische Daten: {params}")
+    universe = make_universe(systems, regions, gates, seed)
+    station_data = make_stations(universe, seed=seed)
+    item_data = make_items(types, seed)
+    main_region = FIRST_REGION_ID
+    region_orders = {
+        region["region_id"]: make_orders(region["region_id"], station_data, types,
+                                         orders if region["region_id"] == main_region else 0, seed)
+        for region in universe.values()
+    }
+    stargate_input = make_stargates(universe)
+
+    workspace = tempfile.mkdtemp(prefix="everouter-bench-")
+    previous_dir = os.getcwd()
+    os.chdir(workspace)
+    try:
+        write_workspace("cache", universe, station_data, item_data, region_orders)
+        universe_path = "cache/universe_sde_cache.json"
+        rng = random.Random(seed)
+        names = [record["name"] for record in build_universe_index(universe).systems.values()]
+        pairs = [(rng.choice(names), rng.choice(names)) for _ in range(ROUTE_PAIRS)]
+
+        def load_universe_json():
+            with open(universe_path, "r", encoding="utf-8") as f:
+                json.load(f)
+
+        results["json_load_universe"] = time_call(load_universe_json, repeat)
+        results["link_resolution"] = time_call(
+            resolve_stargate_links, repeat,
+            setup=lambda: (copy.deepcopy(stargate_input[0]), *stargate_input[1:]))
+        results["build_graph"] = time_call(lambda: build_graph(universe), repeat)
+        results["find_shortest_path"] = time_call(
+            lambda: find_shortest_path(universe, *pairs[0], only_highsec=False), repeat)
+
+        route_graph = RouteGraph.from_universe(universe)
+        results["route_graph_pairs"] = time_call(
+            lambda: [route_graph.route(a, b, only_highsec=False) for a, b in pairs], repeat)
+        results["route_graph_pairs"]["pairs"] = len(pairs)
+
+        station_index = build_station_index(station_data)
+        item_table = ItemTable.from_cache(item_data)
+        orders_path = f"cache/region_{main_region}_all.orders"
+        results["load_orders"] = time_call(lambda: load_orders(orders_path), repeat)
+        table = load_orders(orders_path)
+        results["build_order_book"] = time_call(lambda: build_order_book(table, station_index), repeat)
+        results["build_order_book"]["orders"] = len(table)
+
+        book = build_order_book(table, station_index)
+        source, dest = _busiest_systems(book, 2)
+        results["build_market_data"] = time_call(lambda: build_market_data(book, book, source, dest), repeat)
+        market = build_market_data(book, book, source, dest)
+        candidates = [
+            (data["sell_orders"], data["buy_orders"], item_table.volume(type_id))
+            for type_id, data in market.items()
+        ]
+        results["match_ladders"] = time_call(lambda: match_ladders(candidates, CARGO, BUDGET), repeat)
+        results["match_ladders"]["items"] = len(candidates)
+        results["evaluate_market"] = time_call(lambda: evaluate_market(market, item_table, CARGO, BUDGET), repeat)
+
+        universe_index = build_universe_index(universe)
+        route = route_graph.route(route_graph.names[route_graph.index_of[source]],
+                                  route_graph.names[route_graph.index_of[dest]], only_highsec=False)
+        get_order_book(main_region, station_index, refresh=False)
+        results["analyze_route_trade_opportunities"] = time_call(
+            lambda: analyze_route_trade_opportunities(route, universe_index, item_table, station_index, CARGO, BUDGET,
+                                                      refresh=False), repeat)
+        results["analyze_route_trade_opportunities"]["route_systems"] = len(route)
+
+        # Die belebtesten Systeme als lange Route, seriell gegen den Prozess-Pool
+        long_route = [universe_index.get(system_id)["name"] for system_id in _busiest_systems(book, LONG_ROUTE_STOPS)]
+        results["analyze_long_route_serial"] = time_call(
+            lambda: analyze_route_trade_opportunities(long_route, universe_index, item_table, station_index, CARGO,
+                                                      BUDGET, refresh=False), repeat)
+        results["analyze_long_route_parallel"] = time_call(
+            lambda: analyze_route_parallel(long_route, universe_index, item_table, station_index, CARGO, BUDGET,
+                                           refresh=False), repeat)
+        # Mit nur einer CPU fällt analyze_route_parallel auf den seriellen Pfad zurück, der Wert
+        # sagt dann nichts über die Skalierung
+        parallel = results["analyze_long_route_parallel"]
+        parallel["workers"] = available_workers()
+        parallel["serial_fallback"] = parallel["workers"] == 1
+        parallel["speedup"] = results["analyze_long_route_serial"]["min"] / parallel["min"]
+        results["analyze_long_route_top_k"] = time_call(
+            lambda: analyze_route_trade_opportunities(long_route, universe_index, item_table, station_index, CARGO,
+                                                      BUDGET, refresh=False, top_k=TOP_K), repeat)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": int(time.time()),
+        "params": params,
+        "results": results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduzierbare Benchmarks mit synthetischen Daten")
+    parser.add_argument("--systems", type=int, default=5000)
+    parser.add_argument("--regions", type=int, default=60)
+    parser.add_argument("--gates", type=int, default=7000)
+    parser.add_argument("--orders", type=int, default=400000, help="Orders in der Hauptregion")
+    parser.add_argument("--types", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Ergebnis als JSON in diese Datei schreiben (sonst stdout)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.systems, args.regions, args.gates, args.orders, args.types, args.seed, args.repeat)
+    for name, timing in report["results"].items():
+        print(f"⏱️ {name:36} {timing['min'] * 1000:10.1f} ms (Median {timing['median'] * 1000:.1f} ms)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Ergebnisse gespeichert in {args.output}")
+    else:
+        print(json.dumps(report))
@@ -0,0 +1,217 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import metrics
+
+ESI_BASE = "https://esi.evetech.net/latest"
+DATASOURCE = "tranquility"
+MAX_WORKERS = 16  # gleichzeitige Requests (und Größe des Connection-Pools)
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5  # Sekunden, verdoppelt sich pro Versuch
+REQUEST_TIMEOUT = 30
+ERROR_LIMIT_THRESHOLD = 10  # ab so wenigen verbleibenden Fehlern wird bis zum Reset pausiert
+RETRY_STATUS = {420, 429, 500, 502, 503, 504}
+IN_FLIGHT_PER_WORKER = 2  # höchstens so viele angefragte, noch nicht verarbeitete Seiten pro Worker
+
+
+class EsiError(Exception):
+    pass
+
+
+class EsiClient:
+    def __init__(self, base_url=ESI_BASE, max_workers=MAX_WORKERS, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _wait_for_error_limit(self):
+        with self._lock:
+            delay = self._paused_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _update_error_limit(self, response):
+        remain = response.headers.get("X-ESI-Error-Limit-Remain")
+        reset = response.headers.get("X-ESI-Error-Limit-Reset")
+        if remain is None or reset is None:
+            return
+        try:
+            remain, reset = int(remain), int(reset)
+        except ValueError:
+            return
+        if remain <= ERROR_LIMIT_THRESHOLD or response.status_code == 420:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.time() + reset + 1)
+            metrics.say(f"🛑 ESI-Fehlerlimit fast erreicht ({remain} übrig) – pausiere {reset + 1}s")
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        return self.backoff_base * (2 ** attempt) + random.uniform(0, self.backoff_base)
+
+    def get(self, path, params=None, headers=None):
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_error_limit()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                metrics.inc("esi_request_errors")
+                last_error = e
+                response = None
+            else:
+                metrics.observe("esi_request", time.perf_counter() - started, status=response.status_code)
+                metrics.inc("esi_response_bytes", len(response.content))
+                self._update_error_limit(response)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                last_error = EsiError(f"HTTP {response.status_code} für {url}")
+
+            if attempt < self.max_retries:
+                metrics.inc("esi_retries")
+                time.sleep(self._backoff(attempt, response))
+
+        raise EsiError(f"{url} nach {self.max_retries + 1} Versuchen fehlgeschlagen: {last_error}")
+
+    def _fetch_order_page(self, region_id, order_type, page, etag=None):
+        params = {"datasource": DATASOURCE, "page": page}
+        if order_type != "all":
+            params["order_type"] = order_type
+        headers = {"If-None-Match": etag} if etag else None
+        response = self.get(f"/markets/{region_id}/orders/", params=params, headers=headers)
+        if response.status_code not in (200, 304):
+            raise EsiError(f"Seite {page} für Region {region_id}: HTTP {response.status_code}")
+
+        metrics.inc("esi_pages", status=response.status_code)
+        pages = response.headers.get("X-Pages")
+        return {
+            "page": page,
+            "status": response.status_code,
+            "data": response.json() if response.status_code == 200 else None,
+            "etag": response.headers.get("ETag", etag),
+            "expires": parse_http_date(response.headers.get("Expires")),
+            # Leere Regionen melden X-Pages: 0, haben aber genau eine (leere) Seite
+            "pages": max(int(pages), 1) if pages else None
+        }
+
+    def fetch_regions(self, region_ids, order_type="all", on_region_done=None, etags=None, on_page=None):
+        # Seite 1 jeder Region liefert X-Pages, danach laufen alle restlichen Seiten
+        # aller Regionen über denselben Pool. Mit `etags` ({region_id: {page: etag}})
+        # werden die Seiten konditional abgefragt; unveränderte Seiten kommen mit
+        # Status 304 und data=None zurück.
+        # Ein 304 für eine Seite, zu der es keinen alten Stand gibt (kein ETag bekannt, z.B. jenseits
+        # der Seitenzahl des alten Snapshots), gilt als Cache-Miss: die Seite wird ohne
+        # If-None-Match neu geholt, statt stillschweigend leer zu bleiben.
+        # Mit `on_page(region_id, page_result)` wird jede Seite sofort nach Eintreffen
+        # verarbeitet und ihre Daten danach verworfen; es sind nie mehr als
+        # IN_FLIGHT_PER_WORKER * max_workers Seiten gleichzeitig angefragt.
+        etags = etags or {}
+        pages_by_region = {region_id: {} for region_id in region_ids}
+        page_count = {}
+        failed = {}
+        results = {}
+        refetch = set()  # (region_id, page), die ohne ETag neu geholt werden
+        backlog = deque((region_id, 1) for region_id in region_ids)
+        max_in_flight = IN_FLIGHT_PER_WORKER * self.max_workers
+
+        def submit(executor):
+            while backlog and len(pending) < max_in_flight:
+                region_id, page = backlog.popleft()
+                if region_id in failed:
+                    continue
+                etag = None if (region_id, page) in refetch else etags.get(region_id, {}).get(page)
+                future = executor.submit(self._fetch_order_page, region_id, order_type, page, etag)
+                pending[future] = (region_id, page)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            submit(executor)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    region_id, page = pending.pop(future)
+                    if region_id in failed:
+                        continue
+                    try:
+                        result = future.result()
+                        if result["status"] == 304 and page not in etags.get(region_id, {}):
+                            if (region_id, page) in refetch:
+                                raise EsiError(f"Seite {page} für Region {region_id}: 304 ohne bekannten Stand")
+                            metrics.inc("esi_unexpected_304")
+                            refetch.add((region_id, page))
+                            backlog.appendleft((region_id, page))
+                            continue
+                        if on_page:
+                            on_page(region_id, result)
+                            result["data"] = None
+                    except Exception as e:
+                        failed[region_id] = e
+                        metrics.say(f"❌ Fehler beim Laden der Region {region_id}: {e}")
+                        if on_region_done:
+                            on_region_done(region_id, None)
+                        continue
+
+                    pages_by_region[region_id][page] = result
+                    if page == 1:
+                        pages = result["pages"] if result["pages"] is not None else len(etags.get(region_id, {})) or 1
+                        page_count[region_id] = pages
+                        backlog.extend((region_id, next_page) for next_page in range(2, pages + 1))
+
+                    if len(pages_by_region[region_id]) == page_count[region_id]:
+                        region_pages = pages_by_region.pop(region_id)
+                        page_results = [region_pages[p] for p in range(1, page_count[region_id] + 1)]
+                        results[region_id] = page_results
+                        if on_region_done:
+                            on_region_done(region_id, page_results)
+                submit(executor)
+
+        return results
+
+    def fetch_region_orders(self, region_id, order_type="all"):
+        results = self.fetch_regions([region_id], order_type=order_type)
+        if region_id not in results:
+            raise EsiError(f"Marktorders für Region {region_id} konnten nicht geladen werden")
+        orders = []
+        for page_result in results[region_id]:
+            orders.extend(page_result["data"])
+        return orders
+
+
+def parse_http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,69 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+POLL_INTERVAL = 0.1
+
+
+class FileLock:
+    # Exklusive Sperre über eine Lock-Datei, gilt prozessübergreifend (flock bzw. msvcrt.locking).
+    # Das Betriebssystem gibt die Sperre frei, wenn der Prozess abstürzt, es bleiben keine
+    # verwaisten Leases zurück.
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def _try_lock(self, f):
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def acquire(self, timeout=None):
+        # timeout=None wartet unbegrenzt, 0 versucht es genau einmal; gibt True bei Erfolg zurück
+        if self._file is not None:
+            raise RuntimeError(f"Sperre {self.path} wird bereits gehalten")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        f = open(self.path, "a+b")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._try_lock(f):
+            if deadline is not None and time.monotonic() >= deadline:
+                f.close()
+                return False
+            time.sleep(POLL_INTERVAL)
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    @property
+    def locked(self):
+        return self._file is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
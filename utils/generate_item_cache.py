@@ -1,7 +1,13 @@
-import yaml
 import json
 from tqdm import tqdm
 
+try:
+    from utils.lookup_tables import ItemTable, write_item_table
+    from utils.sde_loader import load_yaml_cached
+except ImportError:  # Start als Skript aus utils/
+    from lookup_tables import ItemTable, write_item_table
+    from sde_loader import load_yaml_cached
+
 TYPEIDS_PATH = "../eve_metadata/sde/fsd/types.yaml"
 
 # <<< OPTIONAL: true = nur Marktitems, false = alle Typen
@@ -9,8 +15,7 @@ ONLY_PUBLISHED = True
 LANGUAGE = "de"
 
 def load_typeids(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return yaml.safe_load(f)
+    return load_yaml_cached(path)
 
 
 def build_item_cache(typeids_data):
@@ -56,9 +61,16 @@ def save_to_json(data, filepath="../cache/item_cache.json"):
     print(f"💾 Itemdaten gespeichert in {filepath}")
 
 
+def save_item_table(data, filepath="../cache/item_table.bin"):
+    # Kompakte Tabelle nach type_id für die Lookups im Handelspfad (siehe utils/lookup_tables.py)
+    write_item_table(filepath, ItemTable.from_cache(data))
+    print(f"💾 Itemtabelle gespeichert in {filepath}")
+
+
 if __name__ == "__main__":
     print("🚀 Starte Verarbeitung der Itemdaten...")
     typeids = load_typeids(TYPEIDS_PATH)
     item_cache = build_item_cache(typeids)
     save_to_json(item_cache)
+    save_item_table(item_cache)
     print("🎉 Alle Items erfolgreich verarbeitet und gespeichert!")
\ No newline at end of file
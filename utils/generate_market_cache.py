@@ -1,16 +1,21 @@
 import json
 import os
 import time
-import requests
 
-ESI_BASE = "https://esi.evetech.net/latest"
+from utils import metrics
+from utils.esi_client import EsiClient, EsiError, ESI_BASE, MAX_WORKERS
+from utils.file_lock import FileLock
+from utils.order_store import OrderStoreWriter, load_orders, export_json
+
 CACHE_DIR = "cache"
 EMPIRE_REGIONS = {
     "aridia", "derelik", "devoid", "domain", "genesis", "kador", "khanid", "kor-azor", "tash-murkon", "thebleaklands",
     "lonetrek", "thecitadel", "theforge", "essence", "everyshore", "placid", "sinqlaison", "solitude",
     "vergevendor", "metropolis", "heimatar", "moldenheath"
 }
-CACHE_DURATION = 60 * 30  # 30 Minuten
+CACHE_DURATION = 60 * 30  # 30 Minuten, nur falls ESI kein Expires liefert
+LOCK_TIMEOUT = 120  # Sekunden, die ein Leser ohne Snapshot auf einen laufenden Download wartet
+LOAD_RETRIES = 3
 
 def get_all_region_ids():
     with open("./cache/universe_sde_cache.json", "r", encoding="utf-8") as f:
@@ -21,56 +26,297 @@ def get_all_region_ids():
             region_ids.append(region_data["region_id"])
     return region_ids
 
-def get_market_orders(region_id, order_type="all"):
-    cache_key = f"{CACHE_DIR}/region_{region_id}_{order_type}.json"
-    if os.path.exists(cache_key) and time.time() - os.path.getmtime(cache_key) < CACHE_DURATION:
-        with open(cache_key, "r", encoding="utf-8") as f:
+def _cache_base(region_id, order_type):
+    return f"{CACHE_DIR}/region_{region_id}_{order_type}"
+
+def _cache_paths(region_id, order_type):
+    # Snapshot unter dem alten, unversionierten Namen und die Metadaten
+    base = _cache_base(region_id, order_type)
+    return f"{base}.orders", f"{base}.meta.json"
+
+def _snapshot_path(region_id, order_type, version):
+    return f"{_cache_base(region_id, order_type)}.{version}.orders"
+
+def _lock_path(region_id, order_type):
+    return f"{_cache_base(region_id, order_type)}.lock"
+
+def load_cache_meta(region_id, order_type="all"):
+    _, meta_path = _cache_paths(region_id, order_type)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
             return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    orders = []
-    page = 1
-    while True:
-        url = f"{ESI_BASE}/markets/{region_id}/orders/"
-        params = {"datasource": "tranquility", "page": page}
-        if order_type != "all":
-            params["order_type"] = order_type
-        response = requests.get(url, params=params)
-        if response.status_code != 200:
-            print(f"❌ Fehler beim Laden von Seite {page} für Region {region_id}: {response.status_code}")
-            break
-        page_data = response.json()
-        if not page_data:
-            break
-        orders.extend(page_data)
-        page += 1
+def current_snapshot_path(region_id, order_type="all", meta=None):
+    # meta.json ist der Zeiger auf den aktuellen Snapshot und wird atomar ersetzt;
+    # Caches ohne "snapshot" liegen noch unter dem alten Namen
+    meta = meta if meta is not None else load_cache_meta(region_id, order_type)
+    if meta and meta.get("snapshot"):
+        data_path = os.path.join(CACHE_DIR, meta["snapshot"])
+    else:
+        data_path, _ = _cache_paths(region_id, order_type)
+    return data_path if os.path.exists(data_path) else None
 
+def cache_expires_at(region_id, order_type="all"):
+    meta = load_cache_meta(region_id, order_type)
+    data_path = current_snapshot_path(region_id, order_type, meta)
+    if data_path is None:
+        return 0
+    if meta and meta.get("expires") is not None:
+        return meta["expires"]
+    return os.path.getmtime(data_path) + CACHE_DURATION
+
+def snapshot_version(region_id, order_type="all"):
+    data_path = current_snapshot_path(region_id, order_type)
+    if data_path is None:
+        return None
+    try:
+        stat = os.stat(data_path)
+    except FileNotFoundError:
+        return None
+    return os.path.basename(data_path), stat.st_mtime_ns, stat.st_size
+
+def _load_region_cache(region_id, order_type):
+    # Zwischen Zeiger lesen und Öffnen kann ein anderer Prozess einen neuen Snapshot
+    # veröffentlicht und den alten aufgeräumt haben, dann den Zeiger neu lesen.
+    # Einmal gemappt bleibt ein Snapshot lesbar, auch wenn er danach gelöscht wird.
+    for attempt in range(LOAD_RETRIES):
+        data_path = current_snapshot_path(region_id, order_type) or _cache_paths(region_id, order_type)[0]
+        try:
+            with metrics.timer("cache_load", kind="orders"):
+                return load_orders(data_path)
+        except FileNotFoundError:
+            if attempt == LOAD_RETRIES - 1:
+                raise
+
+def _write_json(path, data):
+    # Über eine temporäre Datei und os.replace, Leser sehen nie eine halb geschriebene Datei
     os.makedirs(CACHE_DIR, exist_ok=True)
-    with open(cache_key, "w", encoding="utf-8") as f:
-        json.dump(orders, f)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _next_version(meta):
+    return (meta.get("version") or 0) + 1 if meta else 1
+
+def _cleanup_snapshots(region_id, order_type, keep):
+    # Aktueller und vorheriger Snapshot bleiben liegen, damit Leser mit einem eben gelesenen
+    # Zeiger ihn noch öffnen können. Unter Windows scheitert das Löschen gemappter Dateien,
+    # das wird beim nächsten Aufräumen nachgeholt.
+    prefix = os.path.basename(_cache_base(region_id, order_type)) + "."
+    for name in os.listdir(CACHE_DIR):
+        if name.startswith(prefix) and name.endswith(".orders") and name not in keep:
+            try:
+                os.remove(os.path.join(CACHE_DIR, name))
+            except OSError:
+                pass
+
+def _store_page_results(region_id, order_type, page_results, writer=None):
+    # Geänderte Seiten hat `writer` bereits beim Eintreffen gespeichert (siehe refresh_regions),
+    # unveränderte Seiten werden hier aus dem alten Snapshot übernommen. Der neue Snapshot bekommt
+    # eine eigene Versionsnummer und wird erst durch das Ersetzen von meta.json sichtbar.
+    # Aufrufer hält die Sperre der Region.
+    _, meta_path = _cache_paths(region_id, order_type)
+    old_meta = load_cache_meta(region_id, order_type)
+    old_path = current_snapshot_path(region_id, order_type, old_meta)
+    old_pages = old_meta["pages"] if old_meta and old_path else []
+
+    expires = [p["expires"] for p in page_results if p["expires"]]
+    meta = {
+        "expires": min(expires) if expires else time.time() + CACHE_DURATION,
+        "pages": []
+    }
+
+    changed = [p["page"] for p in page_results if p["status"] != 304]
+    unchanged_layout = len(page_results) == len(old_pages)
+
+    if not changed and unchanged_layout:
+        # Alles 304: Daten bleiben unangetastet, nur Ablaufzeiten aktualisieren
+        if writer is not None:
+            writer.close()
+        for key in ("version", "snapshot"):
+            if key in old_meta:
+                meta[key] = old_meta[key]
+        for page_result, old_page in zip(page_results, old_pages):
+            meta["pages"].append({"etag": page_result["etag"], "expires": page_result["expires"],
+                                  "count": old_page["count"]})
+        _write_json(meta_path, meta)
+        return 0
+
+    version = _next_version(old_meta)
+    if writer is None:
+        # Nicht `writer or ...`: ein Writer mit nur leeren Seiten hat len() == 0
+        writer = OrderStoreWriter(_snapshot_path(region_id, order_type, version))
+    old_table = load_orders(old_path) if len(changed) < len(page_results) and old_path else None
+    offsets = [0]
+    for old_page in old_pages:
+        offsets.append(offsets[-1] + old_page["count"])
+
+    for page_result in page_results:
+        page = page_result["page"]
+        index = page - 1
+        if page_result["status"] == 304 and index < len(old_pages):
+            count = writer.add_slice(page, old_table, offsets[index], offsets[index + 1])
+        elif "count" in page_result:
+            count = page_result["count"]
+        else:
+            count = writer.add_orders(page, page_result["data"] or [])
+        meta["pages"].append({"etag": page_result["etag"], "expires": page_result["expires"],
+                              "count": count})
 
-    return orders
+    writer.commit()
+    meta["version"] = version
+    meta["snapshot"] = os.path.basename(writer.path)
+    _write_json(meta_path, meta)
+    keep = {meta["snapshot"]}
+    if old_path:
+        keep.add(os.path.basename(old_path))
+    _cleanup_snapshots(region_id, order_type, keep)
+    return len(changed)
 
-def cache_all_regions(order_type="all"):
+def _known_etags(region_id, order_type):
+    meta = load_cache_meta(region_id, order_type)
+    if not meta or current_snapshot_path(region_id, order_type, meta) is None:
+        return {}
+    return {i + 1: page["etag"] for i, page in enumerate(meta["pages"]) if page.get("etag")}
+
+def _lock_regions(region_ids, order_type):
+    # Pro Region aktualisiert nur ein Prozess. Ist die Sperre belegt, wird die Region übersprungen,
+    # Leser arbeiten derweil mit dem bisherigen Snapshot weiter.
+    locks = {}
+    for region_id in region_ids:
+        lock = FileLock(_lock_path(region_id, order_type))
+        if not lock.acquire(timeout=0):
+            metrics.say(f"🔒 Region {region_id}: wird gerade von einem anderen Prozess aktualisiert.")
+            metrics.inc("cache_lock_busy")
+            continue
+        if time.time() < cache_expires_at(region_id, order_type):
+            metrics.say(f"✅ Region {region_id}: inzwischen von einem anderen Prozess aktualisiert.")
+            lock.release()
+            continue
+        locks[region_id] = lock
+    return locks
+
+def refresh_regions(region_ids, order_type="all", max_workers=MAX_WORKERS, base_url=ESI_BASE):
+    locks = _lock_regions(region_ids, order_type)
+    # ETags und Versionsnummern erst unter der Sperre lesen
+    etags = {region_id: _known_etags(region_id, order_type) for region_id in locks}
+    versions = {region_id: _next_version(load_cache_meta(region_id, order_type)) for region_id in locks}
+    refreshed = []
+    writers = {}
+
+    def on_page(region_id, page_result):
+        # Jede geänderte Seite landet sofort als Spalten auf der Platte, die dicts werden verworfen
+        if page_result["status"] == 304:
+            return
+        writer = writers.get(region_id)
+        if writer is None:
+            writer = writers[region_id] = OrderStoreWriter(
+                _snapshot_path(region_id, order_type, versions[region_id]))
+        page_result["count"] = writer.add_orders(page_result["page"], page_result["data"] or [])
+        metrics.inc("orders_ingested", page_result["count"])
+
+    def on_region_done(region_id, page_results):
+        writer = writers.pop(region_id, None)
+        try:
+            if page_results is None:
+                if writer is not None:
+                    writer.close()
+                print(f"⚠️ Fehler beim Aktualisieren der Region {region_id}")
+                return
+            changed = _store_page_results(region_id, order_type, page_results, writer)
+        finally:
+            locks[region_id].release()
+        refreshed.append(region_id)
+        if changed:
+            metrics.say(f"💾 Region {region_id}: {changed}/{len(page_results)} Seiten geändert und gespeichert.")
+        else:
+            metrics.say(f"♻️ Region {region_id}: unverändert (304), nur Ablaufzeit erneuert.")
+
+    if not locks:
+        return refreshed
+    with EsiClient(base_url=base_url, max_workers=max_workers) as client, metrics.timer("market_refresh"):
+        try:
+            client.fetch_regions(list(locks), order_type=order_type, on_region_done=on_region_done, etags=etags,
+                                 on_page=on_page)
+        finally:
+            for writer in writers.values():
+                writer.close()
+            for lock in locks.values():
+                lock.release()
+    return refreshed
+
+def _wait_for_refresh(region_id, order_type):
+    # Ein anderer Prozess lädt die Region gerade; warten, bis er seine Sperre freigibt
+    lock = FileLock(_lock_path(region_id, order_type))
+    if lock.acquire(timeout=LOCK_TIMEOUT):
+        lock.release()
+        return True
+    return False
+
+def ensure_market_orders(region_id, order_type="all", base_url=ESI_BASE, refresh=True):
+    # Sorgt für einen lesbaren Snapshot, ohne ihn zu laden; False, wenn es keinen gibt.
+    # refresh=False: vorhandenen (ggf. abgelaufenen) Snapshot verwenden und nie bei ESI
+    # anfragen, z.B. wenn ein Hintergrund-Thread die Aktualisierung übernimmt
+    if time.time() < cache_expires_at(region_id, order_type):
+        return True
+    if not refresh:
+        if current_snapshot_path(region_id, order_type) is None:
+            metrics.inc("cache_missing")
+            return False
+        return True
+
+    try:
+        refresh_regions([region_id], order_type=order_type, base_url=base_url)
+    except EsiError as e:
+        print(f"❌ {e}")
+
+    if current_snapshot_path(region_id, order_type) is None and not _wait_for_refresh(region_id, order_type):
+        print(f"⚠️ Zeitüberschreitung beim Warten auf den Cache für Region {region_id}.")
+    if current_snapshot_path(region_id, order_type) is None:
+        return False
+    if time.time() >= cache_expires_at(region_id, order_type):
+        print(f"⚠️ Verwende veralteten Cache für Region {region_id}.")
+    return True
+
+def get_market_orders(region_id, order_type="all", base_url=ESI_BASE, refresh=True):
+    # Leere Liste, wenn es (bei refresh=False: noch) keinen Snapshot gibt
+    if not ensure_market_orders(region_id, order_type, base_url=base_url, refresh=refresh):
+        return []
+    return _load_region_cache(region_id, order_type)
+
+def cache_all_regions(order_type="all", max_workers=MAX_WORKERS, base_url=ESI_BASE):
     region_ids = get_all_region_ids()
     print(f"🌍 {len(region_ids)} Regionen werden geprüft...")
 
+    stale_regions = []
+    now = time.time()
     for region_id in region_ids:
-        cache_key = f"{CACHE_DIR}/region_{region_id}_{order_type}.json"
-        needs_refresh = False
-
-        if not os.path.exists(cache_key):
-            print(f"📂 Region {region_id}: Kein Cache vorhanden – lade Daten neu.")
-            needs_refresh = True
+        if current_snapshot_path(region_id, order_type) is None:
+            metrics.say(f"📂 Region {region_id}: Kein Cache vorhanden – lade Daten neu.")
+            stale_regions.append(region_id)
         else:
-            age_sec = time.time() - os.path.getmtime(cache_key)
-            if age_sec >= CACHE_DURATION:
-                print(f"⏳ Region {region_id}: Cache ist {int(age_sec / 60)} Minuten alt – wird neu geladen.")
-                needs_refresh = True
+            expires_at = cache_expires_at(region_id, order_type)
+            if now >= expires_at:
+                metrics.say(f"⏳ Region {region_id}: Cache ist abgelaufen – prüfe auf Änderungen.")
+                stale_regions.append(region_id)
             else:
-                print(f"✅ Region {region_id}: Cache ist aktuell ({int(age_sec / 60)} Minuten) – wird nicht aktualisiert.")
+                metrics.say(f"✅ Region {region_id}: Cache ist aktuell (noch {int((expires_at - now) / 60)} Minuten gültig) – wird nicht aktualisiert.")
 
-        if needs_refresh:
-            try:
-                get_market_orders(region_id, order_type=order_type)
-            except Exception as e:
-                print(f"⚠️ Fehler beim Aktualisieren der Region {region_id}: {e}")
+    if not stale_regions:
+        return
+
+    started = time.time()
+    refreshed = refresh_regions(stale_regions, order_type=order_type, max_workers=max_workers, base_url=base_url)
+    print(f"✅ {len(refreshed)}/{len(stale_regions)} Regionen in {time.time() - started:.1f}s aktualisiert.")
+
+def export_region_json(region_id, order_type="all", filepath=None):
+    filepath = filepath or f"{CACHE_DIR}/region_{region_id}_{order_type}.json"
+    table = _load_region_cache(region_id, order_type)
+    export_json(table, filepath)
+    print(f"💾 Region {region_id}: {len(table)} Orders als JSON exportiert nach {filepath}")
+    return filepath
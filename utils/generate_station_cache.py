@@ -1,8 +1,14 @@
-import yaml
 import json
 import os
 from tqdm import tqdm
 
+try:
+    from utils.lookup_tables import StationTable, write_station_table
+    from utils.sde_loader import load_yaml_cached
+except ImportError:  # Start als Skript aus utils/
+    from lookup_tables import StationTable, write_station_table
+    from sde_loader import load_yaml_cached
+
 SDE_BASE_PATH = "../eve_metadata/sde/bsd/staStations.yaml"
 
 
@@ -13,8 +19,7 @@ def generate_station_cache():
         print(f"❌ Datei nicht gefunden: {SDE_BASE_PATH}")
         return
 
-    with open(SDE_BASE_PATH, "r", encoding="utf-8") as file:
-        stations_raw = yaml.safe_load(file)
+    stations_raw = load_yaml_cached(SDE_BASE_PATH)
 
     station_cache = {"by_id": {}, "by_name": {}}
 
@@ -44,7 +49,9 @@ def generate_station_cache():
     with open("../cache/station_cache.json", "w", encoding="utf-8") as f:
         json.dump(station_cache, f, indent=2, ensure_ascii=False)
 
-    print("✅ Stationen erfolgreich verarbeitet und gespeichert in station_cache.json")
+    write_station_table("../cache/station_table.bin", StationTable.from_cache(station_cache))
+
+    print("✅ Stationen erfolgreich verarbeitet und gespeichert in station_cache.json und station_table.bin")
 
 
 if __name__ == "__main__":
@@ -1,26 +1,28 @@
 import os
-import yaml
 import json
-from tqdm import tqdm
 
-SDE_BASE_PATH = "../eve_metadata/sde/universe/eve"
+try:
+    from utils.sde_loader import load_yaml, parallel_map
+except ImportError:  # Start als Skript aus utils/
+    from sde_loader import load_yaml, parallel_map
 
-stargate_to_system = {}
-stargate_links = {}
+SDE_BASE_PATH = "../eve_metadata/sde/universe/eve"
+MAX_WORKERS = None  # None = alle Kerne
 
 def get_solarsystem_yaml_paths(base_path):
+    # Sortiert, damit die Reihenfolge im Cache nicht vom Dateisystem abhängt
     system_paths = []
-    for region_name in os.listdir(base_path):
+    for region_name in sorted(os.listdir(base_path)):
         region_path = os.path.join(base_path, region_name)
         if not os.path.isdir(region_path):
             continue
 
-        for constellation_name in os.listdir(region_path):
+        for constellation_name in sorted(os.listdir(region_path)):
             const_path = os.path.join(region_path, constellation_name)
             if not os.path.isdir(const_path):
                 continue
 
-            for system_name in os.listdir(const_path):
+            for system_name in sorted(os.listdir(const_path)):
                 system_path = os.path.join(const_path, system_name)
                 yaml_file = os.path.join(system_path, "solarsystem.yaml")
                 if os.path.isfile(yaml_file):
@@ -30,22 +32,20 @@ def get_solarsystem_yaml_paths(base_path):
 
 def parse_yaml_file(file_path):
     if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        return load_yaml(file_path)
     return {}
 
 
-def parse_solarsystem_yaml(yaml_path, current_system_id):
+def parse_solarsystem_yaml(yaml_path):
+    # Läuft im Worker-Prozess: liefert das System und dessen Stargates {gate_id: destination}
     data = parse_yaml_file(yaml_path)
 
     stargates_raw = data.get("stargates", {})
+    gates = {}
 
     if isinstance(stargates_raw, dict):
         for gate_id_str, gate_data in stargates_raw.items():
-            gate_id = int(gate_id_str)
-            stargate_to_system[gate_id] = current_system_id
-            if "destination" in gate_data:
-                stargate_links[gate_id] = gate_data["destination"]
+            gates[int(gate_id_str)] = gate_data.get("destination")
 
     result = {
         "solarSystemID": data.get("solarSystemID"),
@@ -74,20 +74,46 @@ def parse_solarsystem_yaml(yaml_path, current_system_id):
             if "npcStations" in moon:
                 result["stations"].extend(list(moon["npcStations"].keys()))
 
-    return result
+    return result, gates
+
 
+def resolve_stargate_links(systems_by_id, stargate_to_system, stargate_links):
+    # Trägt jede Gate-Verbindung beidseitig in "connections" ein, gibt die Anzahl der Links zurück
+    connected = set()
+    added_links = 0
+    for from_gate_id, dest in stargate_links.items():
+        from_sys = stargate_to_system.get(from_gate_id)
+        to_gate_id = dest if isinstance(dest, int) else dest.get("stargateID")
+        to_sys = stargate_to_system.get(to_gate_id)
+
+        if from_sys and to_sys and from_sys != to_sys:
+            for a, b in ((from_sys, to_sys), (to_sys, from_sys)):
+                if (a, b) in connected:
+                    continue
+                connected.add((a, b))
+                for system in systems_by_id.get(a, []):
+                    system["connections"].append(b)
+            added_links += 1
+    return added_links
 
-def build_sde_universe_cache():
+
+def build_sde_universe_cache(max_workers=MAX_WORKERS):
     universe = {}
 
     print("🔍 Durchsuche SDE-Verzeichnis...")
     paths = get_solarsystem_yaml_paths(SDE_BASE_PATH)
     print(f"📁 {len(paths)} solarsystem.yaml-Dateien gefunden")
 
+    parsed = parallel_map(parse_solarsystem_yaml, [p[3] for p in paths], max_workers=max_workers,
+                          desc="📦 Parse Systeme")
+
     region_cache = {}
     constellation_cache = {}
+    systems_by_id = {}  # solarSystemID -> geparste Systemeinträge
+    stargate_to_system = {}
+    stargate_links = {}
 
-    for region, constellation, system, yaml_path in tqdm(paths, desc="📦 Verarbeite Systeme"):
+    for (region, constellation, system, yaml_path), (parsed_system, gates) in zip(paths, parsed):
         region_key = region.lower()
         constellation_key = constellation.lower()
         system_key = system.lower()
@@ -118,30 +144,16 @@ def build_sde_universe_cache():
                 "systems": {}
             }
 
-        system_data = parse_yaml_file(yaml_path)
-        sys_id = system_data.get("solarSystemID")
-        parsed_system = parse_solarsystem_yaml(yaml_path, sys_id)
+        for gate_id, destination in gates.items():
+            stargate_to_system[gate_id] = parsed_system["solarSystemID"]
+            if destination is not None:
+                stargate_links[gate_id] = destination
 
         universe[region_key]["constellations"][constellation_key]["systems"][system_key] = parsed_system
+        systems_by_id.setdefault(parsed_system["solarSystemID"], []).append(parsed_system)
 
     print("🔗 Setze Verbindungen zwischen Systemen...")
-    added_links = 0
-    for from_gate_id, dest in stargate_links.items():
-        from_sys = stargate_to_system.get(from_gate_id)
-        to_gate_id = dest if isinstance(dest, int) else dest.get("stargateID")
-        to_sys = stargate_to_system.get(to_gate_id)
-
-        if from_sys and to_sys and from_sys != to_sys:
-            for region in universe.values():
-                for constellation in region["constellations"].values():
-                    for system in constellation["systems"].values():
-                        if system["solarSystemID"] == from_sys:
-                            if to_sys not in system["connections"]:
-                                system["connections"].append(to_sys)
-                        elif system["solarSystemID"] == to_sys:
-                            if from_sys not in system["connections"]:
-                                system["connections"].append(from_sys)
-            added_links += 1
+    added_links = resolve_stargate_links(systems_by_id, stargate_to_system, stargate_links)
 
     print(f"✅ {added_links} Verbindungen zwischen Systemen hinzugefügt.")
     print("✅ Verarbeitung abgeschlossen.")
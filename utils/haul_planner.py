@@ -0,0 +1,171 @@
+from array import array
+from collections import namedtuple
+
+from utils import metrics
+from utils.basket_optimizer import optimize_basket
+from utils.matching import match_ladder
+from utils.order_book import Ladder, empty_ladder, get_order_book
+from utils.trade_analysis import get_region_id_by_system_name
+
+# Plant eine einzige Fahrt entlang der Route: an jedem Halt wird verkauft, was für diesen Halt
+# gekauft wurde, und mit dem verbleibenden Frachtraum und ISK neu eingekauft. Beam-Search über
+# die Halte; Orderbücher werden pro Halt genau einmal aufgebaut.
+BEAM_WIDTH = 8
+BASKET_TIME = 0.02  # Sekunden pro Warenkorb-Optimierung an einem Halt
+RESERVE_SHARES = (1.0, 0.5)  # Anteil von Frachtraum und ISK, der an einem Halt eingesetzt werden darf
+
+# Eine Ladung: an Halt `source` gekauft, an Halt `target` verkauft. Der Erlös steht schon beim
+# Kauf fest, weil die dafür nötige Tiefe der Kauforders am Ziel reserviert wird.
+Lot = namedtuple("Lot", ["type_id", "source", "target", "units", "cost", "revenue", "m3"])
+
+# isk: verfügbares Geld, lots: unterwegs befindliche Ladungen, used: (Halt, type_id) -> am Ziel
+# bereits reservierte Einheiten der Kauforders, stops: Aktionen je Halt
+HaulState = namedtuple("HaulState", ["isk", "lots", "used", "stops"])
+
+
+def _equity(state):
+    return state.isk + sum(lot.revenue for lot in state.lots)
+
+
+def _remaining(ladder, used):
+    # Leiter ohne die ersten `used` Einheiten
+    if not used:
+        return ladder
+    taken = 0
+    for k, volume in enumerate(ladder.volumes):
+        if taken + volume > used:
+            volumes = array("q", ladder.volumes[k:])
+            volumes[0] -= used - taken
+            return Ladder(ladder.prices[k:], volumes, ladder.order_ids[k:])
+        taken += volume
+    return empty_ladder()
+
+
+def _stop_books(route, universe_index, station_index, refresh):
+    # Pro Halt {type_id: {"sell": Ladder, "buy": Ladder}}, jedes Regions-Orderbuch einmal geladen
+    region_books = {}
+    stops = []
+    for system_name in route:
+        region_id, system_id = get_region_id_by_system_name(universe_index, system_name)
+        if not region_id or not system_id:
+            stops.append({})
+            continue
+        if region_id not in region_books:
+            region_books[region_id] = get_order_book(region_id, station_index, order_type="all", refresh=refresh)
+        stops.append(region_books[region_id].get(system_id, {}))
+    return stops
+
+
+def _targets(stops, item_table):
+    # Pro Halt: type_id -> spätere Halte, deren bester Bid über dem besten Ask hier liegt
+    bid_stops = {}
+    for j, book in enumerate(stops):
+        for type_id, sides in book.items():
+            if sides["buy"].prices:
+                bid_stops.setdefault(type_id, []).append((j, sides["buy"].prices[0]))
+
+    targets = []
+    for i, book in enumerate(stops):
+        stop_targets = {}
+        for type_id, sides in book.items():
+            if not sides["sell"].prices or type_id not in item_table:
+                continue
+            best_ask = sides["sell"].prices[0]
+            later = [j for j, best_bid in bid_stops.get(type_id, ()) if j > i and best_bid > best_ask]
+            if later:
+                stop_targets[type_id] = later
+        targets.append(stop_targets)
+    return targets
+
+
+def _buy_candidates(state, i, stops, targets, item_table, cargo, isk):
+    # Je Typ das spätere Ziel mit dem höchsten Gewinn bei den noch freien Kauforders
+    candidates = []
+    for type_id, later in targets[i].items():
+        sell = stops[i][type_id]["sell"]
+        volume = item_table.volume(type_id)
+        best = None
+        for j in later:
+            buy = _remaining(stops[j][type_id]["buy"], state.used.get((j, type_id), 0))
+            profit = match_ladder(sell, buy, volume, cargo, isk)[1]
+            if profit > 0 and (best is None or profit > best[0]):
+                best = (profit, j, buy)
+        if best is not None:
+            candidates.append(((type_id, best[1]), sell, best[2], volume))
+    return candidates
+
+
+def _advance(state, i, route, stops, targets, item_table, cargo_capacity):
+    # Alle Nachfolger eines Zustands an Halt i: erst Ankünfte verkaufen, dann nichts kaufen
+    # oder einen Warenkorb mit vollem bzw. halbem Einsatz von Frachtraum und ISK
+    isk = state.isk
+    sold = []
+    lots = []
+    for lot in state.lots:
+        if lot.target == i:
+            isk += lot.revenue
+            sold.append(lot)
+        else:
+            lots.append(lot)
+    free_cargo = cargo_capacity - sum(lot.m3 for lot in lots)
+
+    def stop_entry(bought):
+        return {
+            "system": route[i],
+            "sell": [{"item_id": str(lot.type_id), "name": item_table.name(lot.type_id), "units": lot.units,
+                      "revenue": lot.revenue, "bought_at": route[lot.source]} for lot in sold],
+            "buy": [{"item_id": str(lot.type_id), "name": item_table.name(lot.type_id), "units": lot.units,
+                     "cost": lot.cost, "sell_at": route[lot.target]} for lot in bought],
+            "isk": isk - sum(lot.cost for lot in bought),
+            "cargo_used": cargo_capacity - free_cargo + sum(lot.m3 for lot in bought)
+        }
+
+    successors = [HaulState(isk, tuple(lots), state.used, state.stops + (stop_entry([]),))]
+    if free_cargo <= 0 or isk <= 0 or not targets[i]:
+        return successors
+
+    candidates = _buy_candidates(state, i, stops, targets, item_table, free_cargo, isk)
+    if not candidates:
+        return successors
+    for share in RESERVE_SHARES:
+        basket = optimize_basket(candidates, free_cargo * share, isk * share, time_budget=BASKET_TIME)
+        if not basket["items"]:
+            continue
+        used = dict(state.used)
+        bought = []
+        for entry in basket["items"]:
+            type_id, target = entry["key"]
+            used[(target, type_id)] = used.get((target, type_id), 0) + entry["units"]
+            bought.append(Lot(type_id, i, target, entry["units"], entry["isk_spent"],
+                              entry["isk_spent"] + entry["profit"], entry["m3_used"]))
+        successors.append(HaulState(isk - basket["isk_spent"], tuple(lots + bought), used,
+                                    state.stops + (stop_entry(bought),)))
+    return successors
+
+
+@metrics.timed("haul_plan")
+def plan_haul(route, universe_index, item_table, station_index, cargo_capacity, budget, refresh=True,
+              beam_width=BEAM_WIDTH):
+    # Eine Fahrt über alle Halte der Route mit durchgereichtem Frachtraum und ISK
+    stops = _stop_books(route, universe_index, station_index, refresh)
+    targets = _targets(stops, item_table)
+
+    beam = [HaulState(budget, (), {}, ())]
+    for i in range(len(route)):
+        successors = []
+        for state in beam:
+            successors.extend(_advance(state, i, route, stops, targets, item_table, cargo_capacity))
+        # Stabil sortiert: bei gleichem Wert bleibt der Zustand mit weniger Käufen vorn
+        successors.sort(key=_equity, reverse=True)
+        beam = successors[:beam_width]
+        metrics.inc("haul_states", len(successors))
+
+    best = max(beam, key=lambda state: state.isk)
+    return {
+        "route": list(route),
+        "stops": [entry for entry in best.stops if entry["sell"] or entry["buy"]],
+        "start_isk": budget,
+        "final_isk": best.isk,
+        "total_profit": best.isk - budget,
+        "max_cargo_used": max((entry["cargo_used"] for entry in best.stops), default=0.0)
+    }
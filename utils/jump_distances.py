@@ -0,0 +1,208 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+
+from tqdm import tqdm
+
+from utils.routing import POLICIES, load_route_graph
+
+# Sicherheitsmodus -> Routen-Policy aus utils.routing
+MODES = {"highsec": "highsec", "prefer-safer": "prefer-safer", "any": "shortest"}
+UNREACHABLE = 0xFFFF
+MAGIC = b"EVEJMP01"
+
+
+def graph_fingerprint(route_graph, mode):
+    # Ändert sich bei anderem Graph oder anderer Filterung/Gewichtung des Modus
+    crc = 0
+    allowed, weights = route_graph.policy_view(POLICIES[MODES[mode]])
+    for part in (route_graph.ids, route_graph.offsets, route_graph.neighbors, allowed, weights):
+        if part is not None:
+            crc = zlib.crc32(bytes(part), crc)
+    return crc
+
+
+def _bfs(route_graph, source, allowed):
+    n = len(route_graph)
+    dist = array("H", [UNREACHABLE]) * n
+    dist[source] = 0
+    offsets = route_graph.offsets
+    neighbors = route_graph.neighbors
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        next_dist = dist[node] + 1
+        for k in range(offsets[node], offsets[node + 1]):
+            neighbor = neighbors[k]
+            if dist[neighbor] != UNREACHABLE:
+                continue
+            if allowed is not None and not allowed[neighbor]:
+                continue
+            dist[neighbor] = next_dist
+            queue.append(neighbor)
+    return dist
+
+
+def _weighted_jumps(route_graph, source, allowed, weights):
+    # Dijkstra über die Policy-Gewichte, gespeichert werden die Sprünge der günstigsten Route
+    n = len(route_graph)
+    dist = array("H", [UNREACHABLE]) * n
+    best = {source: 0.0}
+    offsets = route_graph.offsets
+    neighbors = route_graph.neighbors
+    heap = [(0.0, 0, source)]
+    while heap:
+        cost, jumps, node = heapq.heappop(heap)
+        if dist[node] != UNREACHABLE:
+            continue
+        dist[node] = jumps
+        for k in range(offsets[node], offsets[node + 1]):
+            neighbor = neighbors[k]
+            if dist[neighbor] != UNREACHABLE:
+                continue
+            if allowed is not None and not allowed[neighbor]:
+                continue
+            new_cost = cost + weights[neighbor]
+            if new_cost < best.get(neighbor, float("inf")):
+                best[neighbor] = new_cost
+                heapq.heappush(heap, (new_cost, jumps + 1, neighbor))
+    return dist
+
+
+def single_source_distances(route_graph, source, mode="highsec"):
+    # Sprünge vom Graph-Index `source` zu allen Knoten (UNREACHABLE = nicht erreichbar)
+    if mode not in MODES:
+        raise ValueError(f"Unbekannter Sicherheitsmodus: {mode}")
+    allowed, weights = route_graph.policy_view(POLICIES[MODES[mode]])
+    if weights is None:
+        return _bfs(route_graph, source, allowed)
+    return _weighted_jumps(route_graph, source, allowed, weights)
+
+
+def table_nodes(route_graph, mode):
+    # Nur Systeme mit Gates, die die Policy des Modus zulässt (Highsec: nur Highsec-Systeme)
+    allowed, _ = route_graph.policy_view(POLICIES[MODES[mode]])
+    offsets = route_graph.offsets
+    return [i for i in range(len(route_graph))
+            if offsets[i + 1] > offsets[i] and (allowed is None or allowed[i])]
+
+
+class DistanceTable:
+    def __init__(self, route_graph, mode, nodes, matrix, source=None):
+        self.route_graph = route_graph
+        self.mode = mode
+        self.nodes = nodes
+        self.matrix = matrix
+        self.position = {node: pos for pos, node in enumerate(nodes)}
+        self._source = source  # hält das mmap am Leben
+        self._fallback = {}
+
+    def _row_for_index(self, index):
+        pos = self.position.get(index)
+        if pos is not None:
+            m = len(self.nodes)
+            return self.matrix[pos * m:(pos + 1) * m], True
+        if index not in self._fallback:
+            self._fallback[index] = single_source_distances(self.route_graph, index, self.mode)
+        return self._fallback[index], False
+
+    def distance(self, from_id, to_id):
+        index_of = self.route_graph.index_of
+        if from_id not in index_of or to_id not in index_of:
+            return None
+        row, in_table = self._row_for_index(index_of[from_id])
+        to_index = index_of[to_id]
+        if in_table:
+            pos = self.position.get(to_index)
+            jumps = row[pos] if pos is not None else UNREACHABLE
+        else:
+            jumps = row[to_index]
+        return None if jumps == UNREACHABLE else jumps
+
+    def distances_from(self, from_id):
+        # {solarSystemID: Sprünge} für alle erreichbaren Systeme
+        index_of = self.route_graph.index_of
+        if from_id not in index_of:
+            return {}
+        row, in_table = self._row_for_index(index_of[from_id])
+        ids = self.route_graph.ids
+        targets = self.nodes if in_table else range(len(ids))
+        return {ids[node]: jumps for node, jumps in zip(targets, row) if jumps != UNREACHABLE}
+
+
+def build_distance_table(route_graph, mode="highsec"):
+    nodes = table_nodes(route_graph, mode)
+    matrix = array("H")
+    for node in tqdm(nodes, desc=f"📏 Sprungdistanzen ({mode})"):
+        dist = single_source_distances(route_graph, node, mode)
+        matrix.extend(dist[target] for target in nodes)
+    return DistanceTable(route_graph, mode, nodes, matrix)
+
+
+def table_path_for(universe_path, mode):
+    return os.path.join(os.path.dirname(universe_path), f"jump_distances_{mode.replace('-', '_')}.bin")
+
+
+def write_distance_table(path, table):
+    header = json.dumps({
+        "mode": table.mode,
+        "fingerprint": graph_fingerprint(table.route_graph, table.mode),
+        "byteorder": sys.byteorder,
+        "nodes": table.nodes
+    }).encode("utf-8")
+    data_offset = len(MAGIC) + 4 + len(header)
+    padding = (-data_offset) % 8
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * padding)
+        table.matrix.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_distance_table(path, route_graph):
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(MAGIC)] != MAGIC:
+        return None
+    header_len = struct.unpack_from("<I", mapped, len(MAGIC))[0]
+    start = len(MAGIC) + 4
+    header = json.loads(mapped[start:start + header_len])
+    if header["fingerprint"] != graph_fingerprint(route_graph, header["mode"]) or header["byteorder"] != sys.byteorder:
+        return None
+
+    data_offset = start + header_len
+    data_offset += (-data_offset) % 8
+    nodes = header["nodes"]
+    matrix = memoryview(mapped)[data_offset:data_offset + 2 * len(nodes) * len(nodes)].cast("H")
+    return DistanceTable(route_graph, header["mode"], nodes, matrix, source=mapped)
+
+
+def load_distance_table(universe_path, mode="highsec", route_graph=None):
+    route_graph = route_graph or load_route_graph(universe_path)
+    path = table_path_for(universe_path, mode)
+    if os.path.exists(path):
+        table = read_distance_table(path, route_graph)
+        if table is not None:
+            return table
+        print(f"♻️ Distanztabelle {path} passt nicht mehr zum Sprunggraph – wird neu berechnet.")
+
+    table = build_distance_table(route_graph, mode)
+    write_distance_table(path, table)
+    print(f"💾 Distanztabelle ({mode}, {len(table.nodes)} Systeme) gespeichert in {path}")
+    return read_distance_table(path, route_graph)
+
+
+if __name__ == "__main__":
+    modes = sys.argv[1:] or ["highsec"]
+    for requested_mode in modes:
+        load_distance_table("cache/universe_sde_cache.json", requested_mode)
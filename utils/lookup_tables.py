@@ -0,0 +1,199 @@
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+# Kompakte, ganzzahlig indizierte Tabellen für Items und Stationen: sortierte ID-Spalte mit
+# parallelen Spalten, als Binärdatei (JSON-Header + Spalten) zum Mappen ohne Parsen.
+MAGIC = b"EVETAB01"
+ALIGN = 8
+ITEM_TABLE_FILENAME = "item_table.bin"
+STATION_TABLE_FILENAME = "station_table.bin"
+UNKNOWN_VOLUME = math.nan
+
+
+def write_table(path, kind, columns, extra=None):
+    # columns: [(Name, array)], alle gleich lang; extra landet im Header (z.B. Itemnamen)
+    count = len(columns[0][1]) if columns else 0
+    header = {"kind": kind, "count": count, "byteorder": sys.byteorder, "columns": [], **(extra or {})}
+
+    # Die Spalten-Offsets hängen von der Header-Länge ab
+    header_len = 0
+    while True:
+        offset = len(MAGIC) + 4 + header_len
+        header["columns"] = []
+        for name, column in columns:
+            offset += (-offset) % ALIGN
+            header["columns"].append({"name": name, "typecode": column.typecode, "offset": offset})
+            offset += count * column.itemsize
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(header_bytes) <= header_len:
+            header_bytes = header_bytes.ljust(header_len)
+            break
+        header_len = len(header_bytes)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for layout, (_, column) in zip(header["columns"], columns):
+            f.write(b"\0" * (layout["offset"] - f.tell()))
+            column.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_table(path, kind):
+    # Gibt (Header, {Name: memoryview}, mmap) zurück oder None, wenn die Datei nicht passt
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mapped[:len(MAGIC)] != MAGIC:
+        return None
+    header_len = struct.unpack_from("<I", mapped, len(MAGIC))[0]
+    start = len(MAGIC) + 4
+    header = json.loads(mapped[start:start + header_len])
+    if header["kind"] != kind or header["byteorder"] != sys.byteorder:
+        return None
+
+    view = memoryview(mapped)
+    columns = {}
+    for column in header["columns"]:
+        size = array(column["typecode"]).itemsize
+        offset = column["offset"]
+        columns[column["name"]] = view[offset:offset + header["count"] * size].cast(column["typecode"])
+    return header, columns, mapped
+
+
+class ItemTable:
+    # type_id aufsteigend mit Volumen und Namen. Für Bulk-Lookups gibt es zusätzlich ein dichtes
+    # Volumen-Array, das direkt über die type_id indiziert wird (NaN = unbekanntes Item).
+    def __init__(self, type_ids, volumes, names, source=None):
+        self.type_ids = type_ids
+        self.volumes = volumes
+        self.names = names
+        self._source = source  # hält das mmap am Leben
+        self.max_type_id = type_ids[-1] if len(type_ids) else -1
+        self._dense_volume = array("d", [UNKNOWN_VOLUME]) * (self.max_type_id + 1)
+        for type_id, volume in zip(type_ids, volumes):
+            self._dense_volume[type_id] = volume
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def __contains__(self, type_id):
+        return 0 <= type_id <= self.max_type_id and not math.isnan(self._dense_volume[type_id])
+
+    def row(self, type_id):
+        i = bisect_left(self.type_ids, type_id)
+        if i < len(self.type_ids) and self.type_ids[i] == type_id:
+            return i
+        return None
+
+    def volume(self, type_id):
+        return self._dense_volume[type_id] if type_id in self else None
+
+    def name(self, type_id):
+        i = self.row(type_id)
+        return self.names[i] if i is not None else None
+
+    def gather_volumes(self, type_ids):
+        # Volumen für eine ganze Spalte von type_ids in einem Durchlauf, NaN für unbekannte
+        if not type_ids:
+            return []
+        if max(type_ids) <= self.max_type_id and min(type_ids) >= 0:
+            return list(map(self._dense_volume.__getitem__, type_ids))
+        dense = self._dense_volume
+        limit = self.max_type_id
+        return [dense[t] if 0 <= t <= limit else UNKNOWN_VOLUME for t in type_ids]
+
+    @classmethod
+    def from_cache(cls, item_data):
+        # Aus dem Format von item_cache.json (by_id mit String-IDs)
+        entries = sorted((int(type_id), entry["volume"], entry["name"])
+                         for type_id, entry in item_data.get("by_id", {}).items())
+        return cls(array("q", [e[0] for e in entries]), array("d", [e[1] for e in entries]),
+                   [e[2] for e in entries])
+
+
+class StationTable:
+    # stationID aufsteigend mit System und Region. Verhält sich beim Lookup wie das
+    # {stationID: solarSystemID}-dict aus build_station_index.
+    # Die Spalten liegen im mmap und kosten keinen Heap. Für die Lookups wird trotzdem bewusst ein
+    # dict gebaut (erst beim ersten Lookup): gather_systems über eine Spalte von 300k location_ids
+    # braucht mit map(dict.get) ~26 ms, über ein dichtes Offset-Array ~50 ms und per Bisektion
+    # noch deutlich länger. Das dict ist mit ein paar tausend NPC-Stationen klein.
+    def __init__(self, station_ids, system_ids, region_ids, source=None):
+        self.station_ids = station_ids
+        self.system_ids = system_ids
+        self.region_ids = region_ids
+        self._source = source
+        self._system_of = None
+
+    def _systems(self):
+        if self._system_of is None:
+            self._system_of = dict(zip(self.station_ids, self.system_ids))
+        return self._system_of
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def __contains__(self, station_id):
+        return station_id in self._systems()
+
+    def __getitem__(self, station_id):
+        return self._systems()[station_id]
+
+    def get(self, station_id, default=None):
+        return self._systems().get(station_id, default)
+
+    def region(self, station_id):
+        i = bisect_left(self.station_ids, station_id)
+        if i < len(self.station_ids) and self.station_ids[i] == station_id:
+            return self.region_ids[i]
+        return None
+
+    def gather_systems(self, location_ids):
+        # solarSystemID für eine ganze Spalte von location_ids, None für unbekannte Stationen
+        return list(map(self._systems().get, location_ids))
+
+    @classmethod
+    def from_cache(cls, station_data):
+        # Aus dem Format von station_cache.json (by_id mit String-IDs)
+        entries = sorted((int(station_id), entry["solarSystemID"], entry.get("regionID") or 0)
+                         for station_id, entry in station_data.get("by_id", {}).items())
+        return cls(array("q", [e[0] for e in entries]), array("q", [e[1] for e in entries]),
+                   array("q", [e[2] for e in entries]))
+
+
+def write_item_table(path, table):
+    write_table(path, "items", [("type_id", array("q", table.type_ids)), ("volume", array("d", table.volumes))],
+                {"names": list(table.names)})
+
+
+def read_item_table(path):
+    loaded = read_table(path, "items")
+    if loaded is None:
+        return None
+    header, columns, mapped = loaded
+    return ItemTable(columns["type_id"], columns["volume"], header["names"], source=mapped)
+
+
+def write_station_table(path, table):
+    write_table(path, "stations", [("station_id", array("q", table.station_ids)),
+                                   ("system_id", array("q", table.system_ids)),
+                                   ("region_id", array("q", table.region_ids))])
+
+
+def read_station_table(path):
+    loaded = read_table(path, "stations")
+    if loaded is None:
+        return None
+    _, columns, mapped = loaded
+    return StationTable(columns["station_id"], columns["system_id"], columns["region_id"], source=mapped)
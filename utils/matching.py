@@ -0,0 +1,110 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from math import inf
+
+BOUND_SLACK = 1 + 1e-9  # Rundungsreserve, damit die Schranke nie unter dem echten Wert liegt
+
+
+def _profitable_depth(sell_prices, buy_prices):
+    # Nur Verkaufsorders unter dem besten Kaufpreis und Kauforders über dem besten Verkaufspreis zählen
+    n_sell = bisect_left(sell_prices, buy_prices[0])
+    best_ask = sell_prices[0]
+    n_buy = 0
+    for price in buy_prices:
+        if price <= best_ask:
+            break
+        n_buy += 1
+    return n_sell, n_buy
+
+
+def ladder_segments(sell, buy, max_units=None):
+    # Zerlegt den profitablen Teil beider Leitern in Segmente mit konstantem Kauf- und
+    # Verkaufspreis. Gibt (lengths, sell_at, buy_at) zurück, sortiert wie der Greedy-Walk.
+    # Mit `max_units` endet die Zerlegung nach so vielen Einheiten.
+    if not sell.prices or not buy.prices or sell.prices[0] >= buy.prices[0]:
+        return [], [], []
+    if max_units is not None and max_units < 1:
+        return [], [], []
+
+    n_sell, n_buy = _profitable_depth(sell.prices, buy.prices)
+    sell_cum = list(accumulate(sell.volumes[:n_sell]))
+    buy_cum = list(accumulate(buy.volumes[:n_buy]))
+    depth = min(sell_cum[-1], buy_cum[-1])
+    if max_units is not None and max_units < depth:
+        depth = int(max_units)
+        sell_cum = sell_cum[:bisect_left(sell_cum, depth) + 1]
+        buy_cum = buy_cum[:bisect_left(buy_cum, depth) + 1]
+
+    # Segmentgrenzen: jede Stelle, an der eine Verkaufs- oder Kauforder aufgebraucht ist.
+    # Innerhalb eines Segments bleiben Kauf- und Verkaufspreis konstant.
+    ends = sorted({c for c in sell_cum if c < depth} | {c for c in buy_cum if c < depth} | {depth})
+    starts = [0] + ends[:-1]
+    sell_at = [sell.prices[bisect_right(sell_cum, s)] for s in starts]
+    buy_at = [buy.prices[bisect_right(buy_cum, s)] for s in starts]
+
+    n = 0
+    while n < len(starts) and sell_at[n] < buy_at[n]:
+        n += 1
+    return [ends[k] - starts[k] for k in range(n)], sell_at[:n], buy_at[:n]
+
+
+def upper_bound(sell, buy, volume_per_unit, cargo_capacity, budget, metric="total_profit", jumps=1):
+    # Günstige Obergrenze ohne Leiter-Walk: (bester Bid - bester Ask) x min(Fracht/Volumen,
+    # Budget/Ask, verfügbare Tiefe). Je Einheit ist der Gewinn höchstens der beste Spread.
+    if not sell.prices or not buy.prices:
+        return 0.0
+    spread = buy.prices[0] - sell.prices[0]
+    if spread <= 0:
+        return 0.0
+    if metric == "profit_per_m3":
+        return spread / volume_per_unit * BOUND_SLACK if volume_per_unit > 0 else inf
+    units = min(sum(sell.volumes), sum(buy.volumes), budget // sell.prices[0])
+    if volume_per_unit > 0:
+        units = min(units, cargo_capacity // volume_per_unit)
+    bound = spread * units * BOUND_SLACK
+    return bound / jumps if metric == "profit_per_jump" else bound
+
+
+def match_ladder(sell, buy, volume_per_unit, cargo_capacity, budget):
+    # Greedy-Walk über beide Leitern, berechnet über kumulierte Volumina statt Order für Order.
+    # Gibt (units, profit, isk_spent, m3_used) zurück und verändert die Leitern nicht.
+    lengths, sell_at, buy_at = ladder_segments(sell, buy)
+    n = len(lengths)
+    if not n:
+        return 0, 0.0, 0.0, 0.0
+
+    cum_units = list(accumulate(lengths))
+    cum_cost = list(accumulate(lengths[k] * sell_at[k] for k in range(n)))
+    cum_profit = list(accumulate(lengths[k] * (buy_at[k] - sell_at[k]) for k in range(n)))
+
+    # Komplett bezahlbare Segmente, die auch in den Frachtraum passen
+    max_units = cargo_capacity // volume_per_unit if volume_per_unit > 0 else float("inf")
+    full = min(bisect_right(cum_cost, budget), bisect_right(cum_units, max_units))
+    units = cum_units[full - 1] if full else 0
+    spent = cum_cost[full - 1] if full else 0.0
+    profit = cum_profit[full - 1] if full else 0.0
+
+    # Angebrochenes Segment, in dem Budget oder Frachtraum ausgehen
+    if full < n:
+        take = int(max(0, min(lengths[full], (budget - spent) // sell_at[full], max_units - units)))
+        units += take
+        spent += take * sell_at[full]
+        profit += take * (buy_at[full] - sell_at[full])
+
+    return units, profit, spent, units * volume_per_unit
+
+
+def match_ladders(candidates, cargo_capacity, budget):
+    # candidates: Folge von (sell_ladder, buy_ladder, volume_per_unit), jeweils mit vollem Budget/Frachtraum
+    units = array("q")
+    profit = array("d")
+    isk_spent = array("d")
+    m3_used = array("d")
+    for sell, buy, volume_per_unit in candidates:
+        u, p, s, m = match_ladder(sell, buy, volume_per_unit, cargo_capacity, budget)
+        units.append(u)
+        profit.append(p)
+        isk_spent.append(s)
+        m3_used.append(m)
+    return {"units": units, "profit": profit, "isk_spent": isk_spent, "m3_used": m3_used}
@@ -0,0 +1,182 @@
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Zähler und Timer für die heißen Pfade; Ausgabe als Prometheus-Text oder JSON.
+# EVEROUTER_QUIET=1 unterdrückt die Fortschrittsmeldungen aus Schleifen,
+# EVEROUTER_PROFILE=cprofile|tracemalloc schaltet die Profilierung eines Laufs ein.
+PREFIX = "everouter"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> Wert
+_timers = {}  # (name, labels) -> [Anzahl, Summe, Maximum]
+_quiet = os.environ.get("EVEROUTER_QUIET", "") not in ("", "0")
+
+
+def set_quiet(quiet=True):
+    global _quiet
+    _quiet = quiet
+
+
+def is_quiet():
+    return _quiet
+
+
+def say(message):
+    # Fortschrittsmeldung, die im Quiet-Modus entfällt; Fehler weiterhin mit print ausgeben
+    if not _quiet:
+        print(message)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        entry = _timers.get(key)
+        if entry is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            if seconds > entry[2]:
+                entry[2] = seconds
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    # Decorator-Variante von timer()
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _timers.clear()
+
+
+def snapshot():
+    # Strukturierte Sicht auf alle Werte, z.B. für JSON-Logs
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        timers = [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": maximum}
+                  for (name, labels), (count, total, maximum) in sorted(_timers.items())]
+    return {"timestamp": time.time(), "counters": counters, "timers": timers}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        timers = sorted(_timers.items())
+
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}_{name}_total"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for (name, labels), (count, total, maximum) in timers:
+        metric = f"{PREFIX}_{name}_seconds"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f"# TYPE {metric}_max gauge")
+            seen.add(metric)
+        lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{metric}_max{_format_labels(labels)} {maximum:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    # .prom -> Prometheus-Textformat, sonst JSON
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".prom"):
+            f.write(render_prometheus())
+        else:
+            json.dump(snapshot(), f, indent=2)
+
+
+@contextlib.contextmanager
+def profiling(mode=None, output=None):
+    # mode: None, "cprofile" oder "tracemalloc"; Ergebnis nach `output` bzw. auf stdout
+    if not mode:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unbekannter Profiling-Modus: {mode}")
+
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if output:
+                profiler.dump_stats(output)
+                print(f"📊 cProfile-Daten gespeichert in {output}")
+            else:
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        return
+
+    tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:25]
+        tracemalloc.stop()
+        report = [f"Speicher aktuell {current / 2 ** 20:.1f} MiB, Spitze {peak / 2 ** 20:.1f} MiB"]
+        report.extend(str(stat) for stat in top)
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write("\n".join(report) + "\n")
+            print(f"📊 tracemalloc-Bericht gespeichert in {output}")
+        else:
+            print("\n".join(report))
+
+
+def profiling_from_env():
+    return profiling(os.environ.get("EVEROUTER_PROFILE") or None, os.environ.get("EVEROUTER_PROFILE_OUTPUT") or None)
@@ -0,0 +1,205 @@
+import threading
+from array import array
+from collections import namedtuple
+
+from utils import metrics
+from utils.generate_market_cache import ensure_market_orders, get_market_orders, snapshot_version
+from utils.lookup_tables import StationTable
+from utils.order_diff import diff_size, diff_snapshots, iter_changes
+
+# Preisleiter einer Seite: Verkauf aufsteigend, Kauf absteigend sortiert
+Ladder = namedtuple("Ladder", ["prices", "volumes", "order_ids"])
+
+# Benachrichtigung an Abonnenten nach jeder Aktualisierung eines Orderbuchs.
+# affected: {(solarSystemID, type_id)} oder None, wenn das Buch komplett neu gebaut wurde.
+BookUpdate = namedtuple("BookUpdate", ["region_id", "order_type", "affected", "old_table", "new_table", "diff"])
+
+# Ab diesem Anteil geänderter Orders ist ein Neuaufbau günstiger als das Einspielen der Deltas
+MAX_DIFF_FRACTION = 0.5
+
+_book_cache = {}  # (region_id, order_type) -> (Version, Stationsindex, Buch, Ordertabelle)
+_book_locks = {}  # (region_id, order_type) -> Lock, serialisiert Aufbau und Deltas einer Region
+_book_locks_guard = threading.Lock()
+_listeners = []
+
+
+def empty_ladder():
+    return Ladder(array("d"), array("q"), array("q"))
+
+
+def build_station_index(station_data):
+    # StationTable, beim Lookup wie ein {stationID: solarSystemID}-dict
+    return StationTable.from_cache(station_data)
+
+
+def _ladder(table, rows, descending):
+    prices = table["price"]
+    rows.sort(key=lambda i: prices[i], reverse=descending)
+    volumes = table["volume_remain"]
+    order_ids = table["order_id"]
+    return Ladder(
+        array("d", [prices[i] for i in rows]),
+        array("q", [volumes[i] for i in rows]),
+        array("q", [order_ids[i] for i in rows])
+    )
+
+
+@metrics.timed("order_book_build")
+def build_order_book(table, station_index, systems=None):
+    # solarSystemID -> type_id -> {"sell": Ladder, "buy": Ladder}; systems schränkt auf diese Systeme ein
+    if not len(table):
+        return {}
+    grouped = {}
+    type_ids = table["type_id"]
+    is_buy = table["is_buy_order"]
+    for i, system_id in enumerate(station_index.gather_systems(table["location_id"])):
+        if system_id is None or (systems is not None and system_id not in systems):
+            continue
+        sides = grouped.setdefault(system_id, {}).setdefault(type_ids[i], ([], []))
+        sides[is_buy[i]].append(i)
+
+    book = {}
+    for system_id, types in grouped.items():
+        system_book = book[system_id] = {}
+        for type_id, (sell_rows, buy_rows) in types.items():
+            system_book[type_id] = {
+                "sell": _ladder(table, sell_rows, descending=False),
+                "buy": _ladder(table, buy_rows, descending=True)
+            }
+    return book
+
+
+def _side_changes(table, rows, station_index):
+    # (solarSystemID, type_id, Seite) -> Zeilen des Snapshots
+    grouped = {}
+    locations = table["location_id"]
+    type_ids = table["type_id"]
+    is_buy = table["is_buy_order"]
+    for i in rows:
+        system_id = station_index.get(locations[i])
+        if system_id is not None:
+            grouped.setdefault((system_id, type_ids[i], is_buy[i]), []).append(i)
+    return grouped
+
+
+@metrics.timed("order_book_apply_diff")
+def apply_diff(book, old_table, new_table, diff, station_index):
+    # Spielt die Deltas zweier Snapshots ein, ohne `book` zu verändern (Copy-on-Write): betroffene
+    # Systeme bekommen eine Kopie ihres dicts, betroffene Leitern werden neu sortiert und als neue
+    # Ladder-Objekte eingesetzt, alles andere wird geteilt. Leser des alten Buchs sehen also nie
+    # einen halben Stand. Gibt (neues Buch, {(solarSystemID, type_id)}) zurück.
+    removed = _side_changes(old_table, diff.removed, station_index)
+    inserted = _side_changes(new_table, diff.inserted, station_index)
+    changed = _side_changes(new_table, [j for _, j in diff.changed], station_index)
+
+    old_ids = old_table["order_id"]
+    new_ids = new_table["order_id"]
+    prices = new_table["price"]
+    volumes = new_table["volume_remain"]
+    affected = set()
+    system_books = {}  # Kopien der betroffenen Systeme
+    for key in removed.keys() | inserted.keys() | changed.keys():
+        system_id, type_id, side = key
+        drop = {old_ids[i] for i in removed.get(key, ())}
+        update = {new_ids[j]: (prices[j], volumes[j]) for j in changed.get(key, ())}
+
+        system_book = system_books.get(system_id)
+        if system_book is None:
+            system_book = system_books[system_id] = dict(book.get(system_id, {}))
+        sides = dict(system_book.get(type_id) or {"sell": empty_ladder(), "buy": empty_ladder()})
+        name = "buy" if side else "sell"
+        entries = [
+            (*update.get(order_id, (price, volume)), order_id)
+            for price, volume, order_id in zip(*sides[name]) if order_id not in drop
+        ]
+        entries.extend((prices[j], volumes[j], new_ids[j]) for j in inserted.get(key, ()))
+        entries.sort(key=lambda entry: entry[0], reverse=bool(side))
+        sides[name] = Ladder(
+            array("d", [entry[0] for entry in entries]),
+            array("q", [entry[1] for entry in entries]),
+            array("q", [entry[2] for entry in entries])
+        )
+
+        if sides["sell"].prices or sides["buy"].prices:
+            system_book[type_id] = sides
+        else:
+            system_book.pop(type_id, None)
+        affected.add((system_id, type_id))
+
+    updated = dict(book)
+    for system_id, system_book in system_books.items():
+        if system_book:
+            updated[system_id] = system_book
+        else:
+            updated.pop(system_id, None)
+    return updated, affected
+
+
+def subscribe(listener):
+    # listener(BookUpdate) wird nach jeder Aktualisierung eines Orderbuchs aufgerufen
+    _listeners.append(listener)
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _notify(update):
+    for listener in list(_listeners):
+        listener(update)
+
+
+def book_changes(update):
+    # Änderungsfeed eines inkrementellen Updates (leer bei komplettem Neuaufbau)
+    if update.diff is None:
+        return iter(())
+    return iter_changes(update.old_table, update.new_table, update.diff)
+
+
+def _region_lock(key):
+    with _book_locks_guard:
+        lock = _book_locks.get(key)
+        if lock is None:
+            lock = _book_locks[key] = threading.Lock()
+        return lock
+
+
+def get_order_book(region_id, station_index, order_type="all", refresh=True):
+    # Ist der Snapshot unverändert, bleibt es bei einem stat auf meta.json und Snapshot;
+    # geladen wird die Ordertabelle nur für einen neuen Snapshot. Ein neues Buch wird komplett
+    # aufgebaut und erst dann in einem Schritt in den Cache gelegt; wer das alte Buch gerade
+    # liest, behält es unverändert.
+    if not ensure_market_orders(region_id, order_type=order_type, refresh=refresh):
+        return {}
+    key = (region_id, order_type)
+    version = snapshot_version(region_id, order_type)
+    cached = _book_cache.get(key)
+    if cached and cached[0] == version and cached[1] is station_index:
+        return cached[2]
+
+    with _region_lock(key):
+        # Ein anderer Thread kann dasselbe Update inzwischen eingespielt haben
+        version = snapshot_version(region_id, order_type)
+        cached = _book_cache.get(key)
+        if cached and cached[0] == version and cached[1] is station_index:
+            return cached[2]
+        table = get_market_orders(region_id, order_type=order_type, refresh=False)
+
+        if cached and cached[1] is station_index and len(cached[3]) and len(table):
+            old_table = cached[3]
+            diff = diff_snapshots(old_table, table)
+            if diff_size(diff) <= MAX_DIFF_FRACTION * len(table):
+                book, affected = apply_diff(cached[2], old_table, table, diff, station_index)
+                metrics.inc("order_book_updates", kind="diff")
+                metrics.inc("order_book_changed_orders", diff_size(diff))
+                _book_cache[key] = (version, station_index, book, table)
+                _notify(BookUpdate(region_id, order_type, affected, old_table, table, diff))
+                return book
+
+        book = build_order_book(table, station_index)
+        _book_cache[key] = (version, station_index, book, table)
+        metrics.inc("order_book_updates", kind="rebuild")
+        if cached:
+            _notify(BookUpdate(region_id, order_type, None, cached[3], table, None))
+        return book
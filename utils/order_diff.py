@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+# Zeilennummern: inserted im neuen Snapshot, removed im alten, changed als (alt, neu)
+SnapshotDiff = namedtuple("SnapshotDiff", ["inserted", "removed", "changed"])
+
+
+def diff_snapshots(old_table, new_table):
+    # Vergleich zweier Snapshots einer Region über die order_id
+    old_rows = {order_id: i for i, order_id in enumerate(old_table["order_id"])} if len(old_table) else {}
+    inserted = []
+    changed = []
+    if len(new_table):
+        old_prices = old_table["price"] if old_rows else ()
+        old_volumes = old_table["volume_remain"] if old_rows else ()
+        for j, (order_id, price, volume) in enumerate(zip(new_table["order_id"], new_table["price"],
+                                                          new_table["volume_remain"])):
+            i = old_rows.pop(order_id, None)
+            if i is None:
+                inserted.append(j)
+            elif old_prices[i] != price or old_volumes[i] != volume:
+                changed.append((i, j))
+    removed = sorted(old_rows.values())
+    return SnapshotDiff(inserted, removed, changed)
+
+
+def diff_size(diff):
+    return len(diff.inserted) + len(diff.removed) + len(diff.changed)
+
+
+def _change(kind, row):
+    return {"change": kind, "order_id": row["order_id"], "type_id": row["type_id"],
+            "location_id": row["location_id"], "is_buy_order": row["is_buy_order"],
+            "price": row["price"], "volume_remain": row["volume_remain"]}
+
+
+def iter_changes(old_table, new_table, diff):
+    # Änderungsfeed: ein Eintrag pro eingefügter, entfernter oder geänderter Order
+    for j in diff.inserted:
+        yield _change("inserted", new_table.row(j))
+    for i in diff.removed:
+        yield _change("removed", old_table.row(i))
+    for i, j in diff.changed:
+        old_row = old_table.row(i)
+        entry = _change("changed", new_table.row(j))
+        entry["old_price"] = old_row["price"]
+        entry["old_volume_remain"] = old_row["volume_remain"]
+        yield entry
@@ -0,0 +1,260 @@
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from datetime import datetime
+
+# Spaltenorientiertes Binärformat für Marktorders:
+#   MAGIC | uint32 Header-Länge | Header (JSON) | Spalten (je 8-Byte-aligned)
+# Jede Spalte ist ein Block fester Breite und wird per mmap ohne Kopie geladen.
+MAGIC = b"EVEORDS1"
+ALIGN = 8
+COLUMNS = [
+    ("order_id", "q"),
+    ("type_id", "i"),
+    ("location_id", "q"),
+    ("system_id", "i"),
+    ("price", "d"),
+    ("volume_remain", "q"),
+    ("volume_total", "q"),
+    ("min_volume", "q"),
+    ("is_buy_order", "B"),
+    ("issued", "q"),  # Unix-Zeitstempel
+    ("duration", "i"),
+    ("range", "B"),  # Index in RANGES
+]
+RANGES = ["station", "solarsystem", "region", "1", "2", "3", "4", "5", "10", "20", "30", "40"]
+RANGE_INDEX = {name: i for i, name in enumerate(RANGES)}
+
+
+def parse_issued(value):
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def format_issued(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+def empty_columns():
+    return {name: array(typecode) for name, typecode in COLUMNS}
+
+
+def append_orders(columns, orders):
+    for order in orders:
+        columns["order_id"].append(order["order_id"])
+        columns["type_id"].append(order["type_id"])
+        columns["location_id"].append(order["location_id"])
+        columns["system_id"].append(order.get("system_id") or 0)
+        columns["price"].append(order["price"])
+        columns["volume_remain"].append(order["volume_remain"])
+        columns["volume_total"].append(order.get("volume_total", order["volume_remain"]))
+        columns["min_volume"].append(order.get("min_volume", 1))
+        columns["is_buy_order"].append(1 if order["is_buy_order"] else 0)
+        columns["issued"].append(parse_issued(order["issued"]) if order.get("issued") else 0)
+        columns["duration"].append(order.get("duration", 0))
+        columns["range"].append(RANGE_INDEX.get(order.get("range"), 0))
+    return columns
+
+
+def columns_from_orders(orders):
+    return append_orders(empty_columns(), orders)
+
+
+class OrderTable:
+    def __init__(self, columns, count, source=None):
+        self.columns = columns
+        self.count = count
+        self._source = source  # hält das mmap am Leben
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def row(self, i):
+        c = self.columns
+        return {
+            "order_id": c["order_id"][i],
+            "type_id": c["type_id"][i],
+            "location_id": c["location_id"][i],
+            "system_id": c["system_id"][i],
+            "price": c["price"][i],
+            "volume_remain": c["volume_remain"][i],
+            "volume_total": c["volume_total"][i],
+            "min_volume": c["min_volume"][i],
+            "is_buy_order": bool(c["is_buy_order"][i]),
+            "issued": format_issued(c["issued"][i]),
+            "duration": c["duration"][i],
+            "range": RANGES[c["range"][i]],
+        }
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.row(i)
+
+    def slice_columns(self, start, stop):
+        sliced = empty_columns()
+        for name, column in sliced.items():
+            column.frombytes(memoryview(self.columns[name])[start:stop].cast("B"))
+        return sliced
+
+
+def _padding(offset):
+    return (-offset) % ALIGN
+
+
+def _column_layout(count, header_len):
+    offset = len(MAGIC) + 4 + header_len
+    layout = []
+    for name, typecode in COLUMNS:
+        offset += _padding(offset)
+        layout.append({"name": name, "typecode": typecode, "offset": offset})
+        offset += count * array(typecode).itemsize
+    return layout
+
+
+def _header(count):
+    header = {"count": count, "byteorder": sys.byteorder, "columns": []}
+
+    # Die Spalten-Offsets hängen von der Header-Länge ab
+    header_len = 0
+    while True:
+        header["columns"] = _column_layout(count, header_len)
+        header_bytes = json.dumps(header).encode("utf-8")
+        if len(header_bytes) <= header_len:
+            header_bytes = header_bytes.ljust(header_len)
+            break
+        header_len = len(header_bytes)
+    return header_bytes, header["columns"]
+
+
+def _write_atomic(path, count, write_column):
+    # write_column(f, name) schreibt eine Spalte; Leser sehen nur die alte oder die fertige Datei
+    header_bytes, layout = _header(count)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            for column in layout:
+                f.write(b"\0" * (column["offset"] - f.tell()))
+                write_column(f, column["name"])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_orders(path, columns):
+    _write_atomic(path, len(columns["order_id"]), lambda f, name: columns[name].tofile(f))
+
+
+class OrderStoreWriter:
+    # Schreibt einen Snapshot seitenweise: jede ESI-Seite wird sofort in kompakte Spalten
+    # umgewandelt und an eine temporäre Datei pro Spalte angehängt, sodass nie mehr als eine
+    # Seite als dicts im Speicher liegt. commit() setzt die Seiten in Seitenreihenfolge zur
+    # fertigen Datei zusammen und ersetzt den alten Snapshot atomar.
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        self._spill_dir = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.", dir=directory)
+        self._spills = {name: open(os.path.join(self._spill_dir, name), "w+b") for name, _ in COLUMNS}
+        self._spilled = 0
+        self._pages = {}  # Seite -> (table oder None für Spill-Dateien, start, stop)
+
+    def __len__(self):
+        return sum(stop - start for _, start, stop in self._pages.values())
+
+    def add_orders(self, page, orders):
+        columns = append_orders(empty_columns(), orders)
+        count = len(columns["order_id"])
+        for name, column in columns.items():
+            column.tofile(self._spills[name])
+        self._pages[page] = (None, self._spilled, self._spilled + count)
+        self._spilled += count
+        return count
+
+    def add_slice(self, page, table, start, stop):
+        # Unveränderte Seite (304): Zeilen werden erst beim commit() aus dem alten Snapshot kopiert
+        self._pages[page] = (table, start, stop)
+        return stop - start
+
+    def _write_column(self, f, name):
+        size = array(dict(COLUMNS)[name]).itemsize
+        spill = self._spills[name]
+        for page in sorted(self._pages):
+            table, start, stop = self._pages[page]
+            if table is not None:
+                f.write(memoryview(table[name])[start:stop].cast("B"))
+                continue
+            spill.seek(start * size)
+            remaining = (stop - start) * size
+            while remaining:
+                chunk = spill.read(min(remaining, 1 << 20))
+                if not chunk:
+                    raise IOError(f"Temporäre Spalte {name} für {self.path} ist unvollständig")
+                f.write(chunk)
+                remaining -= len(chunk)
+
+    def commit(self):
+        count = len(self)
+        try:
+            _write_atomic(self.path, count, self._write_column)
+        finally:
+            self.close()
+        return count
+
+    def close(self):
+        for spill in self._spills.values():
+            spill.close()
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+
+def load_orders(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"Leere Orderdatei: {path}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"Keine gültige Orderdatei: {path}")
+    header_len = struct.unpack_from("<I", mapped, len(MAGIC))[0]
+    start = len(MAGIC) + 4
+    header = json.loads(mapped[start:start + header_len])
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"Orderdatei {path} wurde mit anderer Byte-Reihenfolge geschrieben")
+
+    count = header["count"]
+    view = memoryview(mapped)
+    columns = {}
+    for column in header["columns"]:
+        size = array(column["typecode"]).itemsize
+        offset = column["offset"]
+        columns[column["name"]] = view[offset:offset + count * size].cast(column["typecode"])
+    return OrderTable(columns, count, source=mapped)
+
+
+def export_json(table, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(list(table), f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Verwendung: python -m utils.order_store <region.orders> <export.json>")
+        sys.exit(1)
+    table = load_orders(sys.argv[1])
+    export_json(table, sys.argv[2])
+    print(f"💾 {len(table)} Orders exportiert nach {sys.argv[2]}")
@@ -0,0 +1,130 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import metrics, static_data
+from utils.generate_market_cache import current_snapshot_path, ensure_market_orders
+from utils.order_book import build_order_book
+from utils.order_store import load_orders
+from utils.trade_analysis import (
+    TopK,
+    analyze_route_trade_opportunities,
+    build_market_data,
+    collect_top_k,
+    evaluate_market,
+    get_region_id_by_system_name,
+    pair_order,
+    route_opportunity
+)
+
+# Paarweise Auswertung einer Route über mehrere Prozesse. Die Worker bekommen nur IDs und
+# Snapshot-Pfade; die Orderdaten mappen sie selbst nur lesend aus den versionierten Snapshots,
+# statt sie gepickelt zu bekommen, und bauen daraus Orderbücher nur für die Systeme der Route.
+MIN_PARALLEL_PAIRS = 64  # darunter kostet der Start der Prozesse mehr, als er spart
+PAIRS_PER_TASK = 16
+
+# Pro Worker-Prozess
+_static_paths = None
+_books = {}  # (Snapshot-Pfad, Systeme) -> Orderbuch
+
+
+def _init_worker(item_path, station_path):
+    global _static_paths
+    _static_paths = (item_path, station_path)
+    _books.clear()
+
+
+def _route_book(region_id, snapshot, systems, station_index):
+    # Nur genau der Snapshot, den der Elternprozess festgelegt hat. Ist er inzwischen ersetzt und
+    # aufgeräumt, geht der FileNotFoundError an den Elternprozess, der dann seriell rechnet; ein
+    # stiller Wechsel auf den neueren Snapshot würde Paare verschiedener Stände mischen.
+    if region_id is None or snapshot is None:
+        return {}
+    key = (snapshot, systems)
+    book = _books.get(key)
+    if book is None:
+        book = _books[key] = build_order_book(load_orders(snapshot), station_index, systems)
+    return book
+
+
+def _evaluate_pairs(task):
+    # Mit top=(k, Metrik) nur die lokal besten k als rohe TopK-Einträge, sonst alle Treffer
+    stops, snapshots, pairs, cargo_capacity, budget, top = task
+    item_table = static_data.item_table(_static_paths[0])
+    station_index = static_data.station_index(_static_paths[1])
+    systems = frozenset(system_id for _, system_id, _ in stops if system_id is not None)
+
+    opportunities = []
+    local_top = TopK(*top) if top is not None else None
+    for pair_index, i, j in pairs:
+        source_sys, source_sys_id, source_region = stops[i]
+        dest_sys, dest_sys_id, dest_region = stops[j]
+        source_book = _route_book(source_region, snapshots.get(source_region), systems, station_index)
+        dest_book = _route_book(dest_region, snapshots.get(dest_region), systems, station_index)
+        market = build_market_data(source_book, dest_book, source_sys_id, dest_sys_id)
+        if local_top is not None:
+            collect_top_k(local_top, market, item_table, cargo_capacity, budget, jumps=j - i,
+                          order_base=pair_order(pair_index),
+                          make_entry=lambda item: route_opportunity(source_sys, dest_sys, item, item["jumps"]))
+            continue
+        for item in evaluate_market(market, item_table, cargo_capacity, budget):
+            opportunities.append(route_opportunity(source_sys, dest_sys, item, j - i))
+    return local_top.entries() if local_top is not None else opportunities
+
+
+def available_workers():
+    # CPUs, auf denen dieser Prozess laufen darf (in Containern oft weniger als os.cpu_count())
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def analyze_route_parallel(route, universe_index, item_table, station_index, cargo_capacity, budget, refresh=True,
+                           workers=None, item_path=static_data.ITEM_CACHE_PATH,
+                           station_path=static_data.STATION_CACHE_PATH, top_k=None, metric="total_profit"):
+    # Gleiches Ergebnis wie analyze_route_trade_opportunities; kurze Routen laufen seriell
+    pairs = [(i, j) for i in range(len(route) - 1) for j in range(i + 1, len(route))]
+    workers = workers or available_workers()
+    if workers == 1 or len(pairs) < MIN_PARALLEL_PAIRS:
+        return analyze_route_trade_opportunities(route, universe_index, item_table, station_index, cargo_capacity,
+                                                 budget, refresh=refresh, top_k=top_k, metric=metric)
+    top = TopK(top_k, metric) if top_k is not None else None
+
+    stops = []
+    for system_name in route:
+        region_id, system_id = get_region_id_by_system_name(universe_index, system_name)
+        if not region_id or not system_id:
+            region_id = None
+        stops.append((system_name, system_id, region_id))
+
+    # Aktualisieren im Elternprozess, die Worker lesen nur den dann aktuellen Snapshot
+    snapshots = {}
+    for region_id in sorted({region_id for _, _, region_id in stops if region_id is not None}):
+        ensure_market_orders(region_id, refresh=refresh)
+        snapshots[region_id] = current_snapshot_path(region_id)
+
+    indexed = [(pair_index, i, j) for pair_index, (i, j) in enumerate(pairs)]
+    tasks = [(stops, snapshots, indexed[k:k + PAIRS_PER_TASK], cargo_capacity, budget,
+              (top_k, metric) if top is not None else None)
+             for k in range(0, len(pairs), PAIRS_PER_TASK)]
+    workers = min(workers, len(tasks))
+    metrics.say(f"⚙️ {len(pairs)} Routenpaare auf {workers} Prozessen...")
+
+    opportunities = []
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(item_path, station_path))
+    try:
+        with metrics.timer("opportunity_analysis", kind="route_parallel"), executor:
+            # map hält die Reihenfolge der Paare ein, bei gleichem Gewinn bleibt die Sortierung wie seriell
+            for chunk in executor.map(_evaluate_pairs, tasks):
+                if top is not None:
+                    top.merge(chunk)
+                else:
+                    opportunities.extend(chunk)
+    except FileNotFoundError as e:
+        # Ein festgelegter Snapshot wurde während des Laufs ersetzt und aufgeräumt
+        metrics.inc("parallel_snapshot_fallback")
+        metrics.say(f"♻️ Snapshot {os.path.basename(e.filename or '')} ersetzt – werte die Route seriell aus.")
+        return analyze_route_trade_opportunities(route, universe_index, item_table, station_index, cargo_capacity,
+                                                 budget, refresh=False, top_k=top_k, metric=metric)
+    if top is not None:
+        return top.results()
+    return sorted(opportunities, key=lambda x: x["total_profit"], reverse=True)
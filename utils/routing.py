@@ -1,8 +1,59 @@
-import json
 import heapq
-import logging
+import json
+import os
+import pickle
+import threading
+from array import array
+from collections import OrderedDict, namedtuple
+
+from utils import metrics
 
 ONLY_HIGHSEC = True
+HIGHSEC_THRESHOLD = 0.5
+LOWSEC_PENALTY = 10  # safest: ein Sprung nach Lowsec kostet so viel wie 10 Highsec-Sprünge, Nullsec das Doppelte
+GRAPH_FILENAME = "universe_graph.pickle"
+GRAPH_VERSION = 2
+CUSTOM_VIEW_CACHE = 16  # so viele Masken eigener Policies (Meidelisten) bleiben im Speicher
+
+# cost: "shortest" (Sprünge) oder "safest" (sicherheitsgewichtet)
+RoutePolicy = namedtuple("RoutePolicy", ["cost", "min_security", "avoid_systems", "avoid_regions"],
+                         defaults=("shortest", None, frozenset(), frozenset()))
+
+POLICIES = {
+    "shortest": RoutePolicy(),
+    "highsec": RoutePolicy(min_security=HIGHSEC_THRESHOLD),
+    "safest": RoutePolicy(cost="safest"),
+    "prefer-safer": RoutePolicy(cost="safest"),
+}
+
+_graph_cache = {}
+
+
+def _normalize_name(value):
+    # "The Forge", "theforge" und "TheForge" (Verzeichnisname im SDE) sind derselbe Name
+    return "".join(value.split()).lower() if isinstance(value, str) else value
+
+
+def _normalize_names(values):
+    return frozenset(_normalize_name(v) for v in values or ())
+
+
+def make_policy(cost="shortest", min_security=None, avoid_systems=(), avoid_regions=()):
+    if cost not in ("shortest", "safest"):
+        raise ValueError(f"Unbekannte Routenkosten: {cost}")
+    return RoutePolicy(cost, min_security, _normalize_names(avoid_systems), _normalize_names(avoid_regions))
+
+
+def resolve_policy(policy=None, only_highsec=True):
+    if policy is None:
+        return POLICIES["highsec"] if only_highsec else POLICIES["shortest"]
+    if isinstance(policy, str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unbekannte Routen-Policy: {policy}")
+        return POLICIES[policy]
+    if isinstance(policy, dict):
+        return make_policy(**policy)
+    return make_policy(*policy)
 
 def build_graph(universe_data):
     graph = {}
@@ -10,7 +61,7 @@ def build_graph(universe_data):
     name_to_id = {}
     id_to_name = {}
 
-    print("🔧 Baue Graph auf Basis von 'connections'...")
+    metrics.say("🔧 Baue Graph auf Basis von 'connections'...")
 
     for region in universe_data.values():
         for constellation in region["constellations"].values():
@@ -27,60 +78,286 @@ def build_graph(universe_data):
                 for neighbor_id in sys_data.get("connections", []):
                     graph[sys_id].add(neighbor_id)
 
-    print(f"✅ {len(name_to_id)} Systeme verarbeitet.")
+    metrics.say(f"✅ {len(name_to_id)} Systeme verarbeitet.")
     return graph, security, name_to_id, id_to_name
 
 
+class RouteGraph:
+    # Kompakter Sprunggraph im CSR-Format: die Nachbarn von Knoten i liegen in
+    # neighbors[offsets[i]:offsets[i + 1]], Knoten sind dichte Indizes 0..n-1.
+    def __init__(self, ids, names, security, offsets, neighbors, regions, region_names, version=GRAPH_VERSION):
+        self.ids = ids
+        self.names = names
+        self.security = security
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.regions = regions
+        self.region_names = region_names
+        self.version = version
+        self.index_of = {sys_id: i for i, sys_id in enumerate(ids)}
+        self.index_of_name = {name.lower(): i for i, name in enumerate(names)}
+        self._policy_views = {}  # eingebaute Policies, dauerhaft
+        self._custom_views = OrderedDict()  # alle anderen, LRU mit CUSTOM_VIEW_CACHE Einträgen
+        self._views_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    @metrics.timed("graph_build")
+    def from_universe(cls, universe_data):
+        graph, security, _, id_to_name = build_graph(universe_data)
+        region_of = {}
+        region_names = {}
+        for region_name, region in universe_data.items():
+            region_names[region.get("region_id")] = region_name
+            for constellation in region["constellations"].values():
+                for sys_data in constellation["systems"].values():
+                    region_of[sys_data.get("solarSystemID")] = region.get("region_id") or 0
+
+        ids = array("i", sorted(graph))
+        index_of = {sys_id: i for i, sys_id in enumerate(ids)}
+        offsets = array("i", [0])
+        neighbors = array("i")
+        for sys_id in ids:
+            neighbors.extend(sorted(index_of[n] for n in graph[sys_id] if n in index_of))
+            offsets.append(len(neighbors))
+        return cls(
+            ids,
+            [id_to_name[sys_id] for sys_id in ids],
+            array("d", [security[sys_id] or 0.0 for sys_id in ids]),
+            offsets,
+            neighbors,
+            array("i", [region_of[sys_id] for sys_id in ids]),
+            region_names
+        )
+
+    def __getstate__(self):
+        return {"ids": self.ids, "names": self.names, "security": self.security,
+                "offsets": self.offsets, "neighbors": self.neighbors,
+                "regions": self.regions, "region_names": self.region_names, "version": self.version}
+
+    def __setstate__(self, state):
+        # Ältere Pickles ohne Regionen werden über die Version erkannt und neu gebaut
+        state.setdefault("regions", array("i"))
+        state.setdefault("region_names", {})
+        state.setdefault("version", 1)
+        self.__init__(**state)
 
-def find_shortest_path(universe_data, start_name, end_name, only_highsec=True):
-    print(f"🚀 Suche Route von '{start_name}' nach '{end_name}' (nur Highsec: {only_highsec})")
+    def adjacent(self, i):
+        return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
 
-    graph, security, name_to_id, id_to_name = build_graph(universe_data)
+    def policy_view(self, policy):
+        # (allowed-Maske oder None, Kantengewichte oder None), einmal pro Policy berechnet
+        builtin = policy in POLICIES.values()
+        with self._views_lock:
+            view = self._policy_views.get(policy) if builtin else self._custom_views.get(policy)
+            if view is not None:
+                if not builtin:
+                    self._custom_views.move_to_end(policy)
+                return view
 
-    start_id = name_to_id.get(start_name.lower())
-    end_id = name_to_id.get(end_name.lower())
+        allowed = None
+        if policy.min_security is not None or policy.avoid_systems or policy.avoid_regions:
+            allowed = bytearray(len(self))
+            for i, sec in enumerate(self.security):
+                if policy.min_security is not None and sec < policy.min_security:
+                    continue
+                if self.ids[i] in policy.avoid_systems or _normalize_name(self.names[i]) in policy.avoid_systems:
+                    continue
+                region_id = self.regions[i]
+                region_name = _normalize_name(self.region_names.get(region_id))
+                if region_id in policy.avoid_regions or region_name in policy.avoid_regions:
+                    continue
+                allowed[i] = 1
 
-    if start_id is None:
-        print(f"❌ Startsystem '{start_name}' nicht gefunden.")
+        weights = None
+        if policy.cost == "safest":
+            weights = array("d", [
+                1.0 if sec >= HIGHSEC_THRESHOLD else 1.0 + (LOWSEC_PENALTY if sec > 0.0 else 2 * LOWSEC_PENALTY)
+                for sec in self.security
+            ])
+
+        view = (allowed, weights)
+        with self._views_lock:
+            if builtin:
+                self._policy_views[policy] = view
+            else:
+                self._custom_views[policy] = view
+                while len(self._custom_views) > CUSTOM_VIEW_CACHE:
+                    self._custom_views.popitem(last=False)
+        return view
+
+    def highsec_mask(self):
+        return self.policy_view(POLICIES["highsec"])[0]
+
+    def cheapest_path(self, start, end, allowed, weights):
+        # Dijkstra mit Elternzeigern; Gewicht eines Sprungs = Gewicht des Zielsystems
+        if start == end:
+            return [start]
+        if allowed is not None and not allowed[end]:
+            return []
+
+        parents = {start: -1}
+        best = {start: 0.0}
+        done = set()
+        offsets = self.offsets
+        neighbors = self.neighbors
+        heap = [(0.0, 0, start)]
+        while heap:
+            cost, jumps, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            if node == end:
+                path = []
+                while node != -1:
+                    path.append(node)
+                    node = parents[node]
+                path.reverse()
+                return path
+            for k in range(offsets[node], offsets[node + 1]):
+                neighbor = neighbors[k]
+                if neighbor in done:
+                    continue
+                if allowed is not None and not allowed[neighbor]:
+                    continue
+                new_cost = cost + weights[neighbor]
+                if new_cost < best.get(neighbor, float("inf")):
+                    best[neighbor] = new_cost
+                    parents[neighbor] = node
+                    heapq.heappush(heap, (new_cost, jumps + 1, neighbor))
         return []
-    if end_id is None:
-        print(f"❌ Zielsystem '{end_name}' nicht gefunden.")
+
+    def shortest_path(self, start, end, allowed=None):
+        # Bidirektionale Breitensuche mit Elternzeigern. `allowed` ist eine Maske über
+        # alle Knoten; der Startknoten ist immer erlaubt.
+        if start == end:
+            return [start]
+        if allowed is not None and not allowed[end]:
+            return []
+
+        parents_fwd = {start: -1}
+        parents_bwd = {end: -1}
+        frontier_fwd = [start]
+        frontier_bwd = [end]
+        offsets = self.offsets
+        neighbors = self.neighbors
+
+        while frontier_fwd and frontier_bwd:
+            # Immer die kleinere Front erweitern
+            if len(frontier_fwd) <= len(frontier_bwd):
+                frontier, parents, other = frontier_fwd, parents_fwd, parents_bwd
+            else:
+                frontier, parents, other = frontier_bwd, parents_bwd, parents_fwd
+
+            next_frontier = []
+            meeting = None
+            for node in frontier:
+                for k in range(offsets[node], offsets[node + 1]):
+                    neighbor = neighbors[k]
+                    if neighbor in parents:
+                        continue
+                    if allowed is not None and not allowed[neighbor] and neighbor != start:
+                        continue
+                    parents[neighbor] = node
+                    if neighbor in other:
+                        meeting = neighbor
+                        break
+                    next_frontier.append(neighbor)
+                if meeting is not None:
+                    break
+
+            if meeting is not None:
+                path = []
+                node = meeting
+                while node != -1:
+                    path.append(node)
+                    node = parents_fwd[node]
+                path.reverse()
+                node = parents_bwd[meeting]
+                while node != -1:
+                    path.append(node)
+                    node = parents_bwd[node]
+                return path
+
+            if frontier is frontier_fwd:
+                frontier_fwd = next_frontier
+            else:
+                frontier_bwd = next_frontier
+
         return []
 
-    visited = set()
-    heap = [(0, start_id, [])]  # (cost, current_node, path)
+    def route(self, start_name, end_name, only_highsec=True, policy=None):
+        start = self.index_of_name.get(start_name.strip().lower())
+        end = self.index_of_name.get(end_name.strip().lower())
 
-    while heap:
-        cost, current, path = heapq.heappop(heap)
+        if start is None:
+            print(f"❌ Startsystem '{start_name}' nicht gefunden.")
+            return []
+        if end is None:
+            print(f"❌ Zielsystem '{end_name}' nicht gefunden.")
+            return []
 
-        if current in visited:
-            continue
-        visited.add(current)
+        policy = resolve_policy(policy, only_highsec)
+        allowed, weights = self.policy_view(policy)
+        with metrics.timer("route_search", cost=policy.cost):
+            if weights is None:
+                path = self.shortest_path(start, end, allowed)
+            else:
+                path = self.cheapest_path(start, end, allowed, weights)
+        return [self.names[i] for i in path]
 
-        path = path + [current]
 
-        if current == end_id:
-            print(f"✅ Route gefunden mit {len(path)-1} Sprüngen.")
-            return [id_to_name.get(pid, str(pid)) for pid in path]
+def graph_path_for(universe_path):
+    return os.path.join(os.path.dirname(universe_path), GRAPH_FILENAME)
+
+
+def load_route_graph(universe_path, loader=None):
+    # loader(universe_path) liefert die Universumsdaten, falls der Graph neu gebaut werden muss
+    mtime = os.path.getmtime(universe_path)
+    cached = _graph_cache.get(universe_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    graph_path = graph_path_for(universe_path)
+    route_graph = None
+    if os.path.exists(graph_path) and os.path.getmtime(graph_path) >= mtime:
+        with open(graph_path, "rb") as f, metrics.timer("cache_load", kind="graph"):
+            route_graph = pickle.load(f)
+    if route_graph is None or getattr(route_graph, "version", None) != GRAPH_VERSION:
+        if loader is not None:
+            universe = loader(universe_path)
+        else:
+            with open(universe_path, "r", encoding="utf-8") as f, metrics.timer("cache_load", kind="universe"):
+                universe = json.load(f)
+        route_graph = RouteGraph.from_universe(universe)
+        with open(graph_path, "wb") as f:
+            pickle.dump(route_graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"💾 Sprunggraph gespeichert in {graph_path}")
+
+    _graph_cache[universe_path] = (mtime, route_graph)
+    return route_graph
 
-        for neighbor in graph.get(current, []):
-            if neighbor in visited:
-                continue
-            sec = security.get(neighbor, 0.0)
-            if only_highsec and sec < 0.5:
-                print(f"⛔ System {id_to_name.get(neighbor, neighbor)} hat Sicherheitsstatus {sec:.1f} < 0.5 – übersprungen")
-                continue
-            heapq.heappush(heap, (cost + 1, neighbor, path))
 
-    print("⚠️ Keine Route gefunden.")
-    return []
+def find_shortest_path(universe_data, start_name, end_name, only_highsec=True, policy=None):
+    metrics.say(f"🚀 Suche Route von '{start_name}' nach '{end_name}' (nur Highsec: {only_highsec})")
+    route = RouteGraph.from_universe(universe_data).route(start_name, end_name, only_highsec=only_highsec,
+                                                          policy=policy)
+    if route:
+        metrics.say(f"✅ Route gefunden mit {len(route) - 1} Sprüngen.")
+    else:
+        print("⚠️ Keine Route gefunden.")
+    return route
 
-def get_route_between(universe_path, start_system, end_system, only_highsec=True):
+def get_route_between(universe_path, start_system, end_system, only_highsec=True, policy=None, loader=None):
     try:
-        with open(universe_path, "r", encoding="utf-8") as f:
-            universe = json.load(f)
+        route_graph = load_route_graph(universe_path, loader)
     except Exception as e:
         print(f"❌ Fehler beim Laden der Universe-Datei: {e}")
         return []
 
-    return find_shortest_path(universe, start_system, end_system, only_highsec=only_highsec)
+    route = route_graph.route(start_system, end_system, only_highsec=only_highsec, policy=policy)
+    if not route:
+        print(f"⚠️ Keine Route von '{start_system}' nach '{end_system}' gefunden.")
+    return route
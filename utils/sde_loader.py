@@ -0,0 +1,63 @@
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+from tqdm import tqdm
+
+try:
+    from yaml import CSafeLoader as SafeLoader  # libyaml, deutlich schneller
+except ImportError:
+    from yaml import SafeLoader
+
+BINARY_CACHE_DIR = "../cache/sde"
+CHUNKSIZE = 32
+
+
+def load_yaml(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_yaml_cached(path, cache_dir=BINARY_CACHE_DIR):
+    # Geparstes YAML als Pickle ablegen, Schlüssel ist der SHA-256 der Quelldatei
+    name = os.path.basename(path)
+    digest = file_hash(path)[:16]
+    cache_path = os.path.join(cache_dir, f"{name}.{digest}.pickle")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            print(f"⚡ {name} unverändert – lade Binär-Cache {cache_path}")
+            return pickle.load(f)
+
+    print(f"📖 Parse {name} ({'libyaml' if SafeLoader is not yaml.SafeLoader else 'Python'})...")
+    data = load_yaml(path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    for old in os.listdir(cache_dir):
+        if old.startswith(f"{name}.") and old.endswith(".pickle"):
+            os.remove(os.path.join(cache_dir, old))
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+    return data
+
+
+def parallel_map(func, items, max_workers=None, desc=None):
+    # Ergebnisse kommen in der Reihenfolge von `items` zurück, unabhängig von der Worker-Anzahl
+    items = list(items)
+    if max_workers == 1 or len(items) < 2 * CHUNKSIZE:
+        return [func(item) for item in tqdm(items, desc=desc)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(tqdm(executor.map(func, items, chunksize=CHUNKSIZE), total=len(items), desc=desc))
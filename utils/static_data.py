@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+
+from utils import metrics
+from utils.lookup_tables import (
+    ITEM_TABLE_FILENAME,
+    STATION_TABLE_FILENAME,
+    ItemTable,
+    StationTable,
+    read_item_table,
+    read_station_table,
+    write_item_table,
+    write_station_table
+)
+from utils.routing import graph_path_for, load_route_graph
+from utils.universe_index import index_path_for, load_universe_index
+
+# Zentraler Zugriff auf die statischen Daten (Universum, Items, Stationen).
+# Jede Datei wird pro Prozess höchstens einmal gelesen, und zwar erst beim ersten Zugriff.
+# Items und Stationen kommen aus den kompakten Tabellen (utils.lookup_tables) neben den
+# JSON-Dateien; sie werden neu erzeugt, sobald die Quelle neuer ist.
+CACHE_DIR = "cache"
+UNIVERSE_PATH = f"{CACHE_DIR}/universe_sde_cache.json"
+ITEM_CACHE_PATH = f"{CACHE_DIR}/item_cache.json"
+STATION_CACHE_PATH = f"{CACHE_DIR}/station_cache.json"
+
+_lock = threading.RLock()
+_loaded = {}  # (Art, absoluter Pfad) -> (mtime der Quelle, Daten)
+
+
+def _read_json(path, kind):
+    with open(path, "r", encoding="utf-8") as f, metrics.timer("cache_load", kind=kind):
+        return json.load(f)
+
+
+def _memoized(kind, path, load):
+    # Liefert die geladenen Daten, solange sich die Quelldatei nicht geändert hat
+    key = (kind, os.path.abspath(path))
+    mtime = os.path.getmtime(path)
+    with _lock:
+        cached = _loaded.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        data = load(path)
+        _loaded[key] = (mtime, data)
+        return data
+
+
+def table_path_for(path, filename):
+    return os.path.join(os.path.dirname(path), filename)
+
+
+def _load_table(path, kind, filename, read, write, from_cache):
+    # Die Generatoren schreiben die Tabelle neben die JSON-Datei; fehlt sie oder ist sie
+    # älter als die Quelle, wird sie hier einmal aus der JSON-Datei erzeugt
+    table_path = table_path_for(path, filename)
+    if os.path.exists(table_path) and os.path.getmtime(table_path) >= os.path.getmtime(path):
+        with metrics.timer("cache_load", kind=f"{kind}_table"):
+            table = read(table_path)
+        if table is not None:
+            return table
+
+    write(table_path, from_cache(_read_json(path, kind)))
+    metrics.say(f"💾 Tabelle aus {os.path.basename(path)} gespeichert in {table_path}")
+    return read(table_path)
+
+
+def universe_data(path=UNIVERSE_PATH):
+    # Die volle (große) Universumsdatei; wird nur gebraucht, wenn Namensindex oder
+    # Sprunggraph neu erzeugt werden müssen, und nur so lange behalten (siehe _release_universe)
+    return _memoized("universe", path, lambda p: _read_json(p, "universe"))
+
+
+def _release_universe(path):
+    # Sind Namensindex und Sprunggraph auf der Platte aktuell, braucht kein Aufrufer die Rohdaten
+    # mehr; sonst blieben sie z.B. im Trade-Server für die ganze Laufzeit im Speicher
+    mtime = os.path.getmtime(path)
+    for derived in (index_path_for(path), graph_path_for(path)):
+        if not os.path.exists(derived) or os.path.getmtime(derived) < mtime:
+            return
+    with _lock:
+        _loaded.pop(("universe", os.path.abspath(path)), None)
+
+
+def universe_index(path=UNIVERSE_PATH):
+    index = _memoized("universe_index", path, lambda p: load_universe_index(p, loader=universe_data))
+    _release_universe(path)
+    return index
+
+
+def route_graph(path=UNIVERSE_PATH):
+    graph = load_route_graph(path, loader=universe_data)
+    _release_universe(path)
+    return graph
+
+
+def item_table(path=ITEM_CACHE_PATH):
+    return _memoized("items", path, lambda p: _load_table(p, "items", ITEM_TABLE_FILENAME, read_item_table,
+                                                          write_item_table, ItemTable.from_cache))
+
+
+def station_index(path=STATION_CACHE_PATH):
+    # StationTable, beim Lookup wie das {stationID: solarSystemID}-dict aus build_station_index
+    return _memoized("stations", path, lambda p: _load_table(p, "stations", STATION_TABLE_FILENAME, read_station_table,
+                                                             write_station_table, StationTable.from_cache))
+
+
+def reset():
+    with _lock:
+        _loaded.clear()
@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import time
+
+from utils.order_store import empty_columns, write_orders
+
+# Deterministische Testdaten im Format der echten Caches, für Benchmarks ohne ESI/SDE
+FIRST_REGION_ID = 10000001
+FIRST_CONSTELLATION_ID = 20000001
+FIRST_SYSTEM_ID = 30000001
+FIRST_STATION_ID = 60000001
+FIRST_STARGATE_ID = 50000001
+CONSTELLATIONS_PER_REGION = 6
+ISSUED = 1714564800  # 2024-05-01T12:00:00Z
+
+
+def make_universe(systems=5000, regions=60, gates=7000, seed=42):
+    # Innerhalb jeder Region ein zufälliger Spannbaum, dazu eine Kette zwischen den Regionen;
+    # die restlichen Gates verbinden zufällige Systempaare (bevorzugt in derselben Region).
+    rng = random.Random(seed)
+    region_of = [i * regions // systems for i in range(systems)]
+    members = {}
+    for i, region in enumerate(region_of):
+        members.setdefault(region, []).append(i)
+
+    edges = set()
+
+    def connect(a, b):
+        if a != b:
+            edges.add((min(a, b), max(a, b)))
+
+    for region, nodes in members.items():
+        for k in range(1, len(nodes)):
+            connect(nodes[k], nodes[rng.randrange(k)])
+        if region + 1 in members:
+            connect(rng.choice(nodes), rng.choice(members[region + 1]))
+    while len(edges) < gates:
+        a = rng.randrange(systems)
+        nodes = members[region_of[a]] if rng.random() < 0.85 else range(systems)
+        connect(a, rng.choice(nodes))
+
+    connections = {i: [] for i in range(systems)}
+    for a, b in sorted(edges):
+        connections[a].append(FIRST_SYSTEM_ID + b)
+        connections[b].append(FIRST_SYSTEM_ID + a)
+
+    universe = {}
+    for i in range(systems):
+        region = region_of[i]
+        region_key = f"region{region:03d}"
+        if region_key not in universe:
+            universe[region_key] = {"region_id": FIRST_REGION_ID + region, "constellations": {}}
+        constellation = region * CONSTELLATIONS_PER_REGION + members[region].index(i) % CONSTELLATIONS_PER_REGION
+        constellation_key = f"constellation{constellation:04d}"
+        constellations = universe[region_key]["constellations"]
+        if constellation_key not in constellations:
+            constellations[constellation_key] = {
+                "constellation_id": FIRST_CONSTELLATION_ID + constellation,
+                "systems": {}
+            }
+        # Die ersten Regionen sind Highsec, weiter außen wird es unsicherer
+        security = round(max(-1.0, min(1.0, rng.gauss(0.9 - 1.6 * region / regions, 0.25))), 4)
+        constellations[constellation_key]["systems"][f"sys-{i:05d}"] = {
+            "solarSystemID": FIRST_SYSTEM_ID + i,
+            "security": security,
+            "stargates": [],
+            "stations": [],
+            "planet_details": {},
+            "connections": connections[i]
+        }
+    return universe
+
+
+def iter_systems(universe):
+    for region in universe.values():
+        for constellation in region["constellations"].values():
+            for sys_name, sys_data in constellation["systems"].items():
+                yield region, sys_name, sys_data
+
+
+def make_stargates(universe):
+    # Eingabe für resolve_stargate_links wie aus dem SDE: Systeme ohne Verbindungen,
+    # pro Verbindung zwei Gates, die aufeinander zeigen
+    systems_by_id = {}
+    stargate_to_system = {}
+    stargate_links = {}
+    gate_of = {}
+    next_gate = FIRST_STARGATE_ID
+    for _, _, sys_data in iter_systems(universe):
+        sys_id = sys_data["solarSystemID"]
+        systems_by_id[sys_id] = [{"solarSystemID": sys_id, "connections": []}]
+        for neighbor_id in sys_data["connections"]:
+            gate_of[(sys_id, neighbor_id)] = next_gate
+            stargate_to_system[next_gate] = sys_id
+            next_gate += 1
+    for (sys_id, neighbor_id), gate_id in gate_of.items():
+        stargate_links[gate_id] = {"stargateID": gate_of[(neighbor_id, sys_id)]}
+    return systems_by_id, stargate_to_system, stargate_links
+
+
+def make_stations(universe, per_system=2, seed=42):
+    rng = random.Random(seed)
+    stations = {}
+    next_station = FIRST_STATION_ID
+    for region, sys_name, sys_data in iter_systems(universe):
+        for _ in range(rng.randint(0, per_system * 2)):
+            stations[str(next_station)] = {
+                "name": f"{sys_name} - Station {next_station}",
+                "solarSystemID": sys_data["solarSystemID"],
+                "regionID": region["region_id"]
+            }
+            next_station += 1
+    return {"by_id": stations, "by_name": {entry["name"]: int(station_id) for station_id, entry in stations.items()}}
+
+
+def make_items(types=5000, seed=42):
+    rng = random.Random(seed)
+    items = {}
+    for type_id in range(1, types + 1):
+        items[str(type_id)] = {
+            "name": f"Item {type_id}",
+            "volume": rng.choice([0.01, 0.1, 1.0, 2.5, 5.0, 10.0, 50.0, 500.0])
+        }
+    return {"by_id": items, "by_name": {entry["name"]: int(type_id) for type_id, entry in items.items()}}
+
+
+def make_orders(region_id, station_data, types=5000, orders=400000, seed=42, first_order_id=1):
+    # Typen Zipf-ähnlich verteilt (wenige sehr liquide Items), Preise ±20 % um einen Basispreis je Typ
+    rng = random.Random(seed * 1000003 + region_id)
+    stations = [int(station_id) for station_id, entry in station_data["by_id"].items()
+                if entry["regionID"] == region_id]
+    system_of = {int(station_id): entry["solarSystemID"] for station_id, entry in station_data["by_id"].items()}
+    columns = empty_columns()
+    if not stations:
+        return columns
+
+    # Handelsknoten: ein Teil der Stationen bekommt den Großteil der Orders
+    hubs = stations[:max(1, len(stations) // 20)]
+    base_price = [0.0] + [10 ** rng.uniform(0, 7) for _ in range(types)]
+    for k in range(orders):
+        type_id = min(types, int(rng.paretovariate(1.1)))
+        station_id = rng.choice(hubs) if rng.random() < 0.7 else rng.choice(stations)
+        columns["order_id"].append(first_order_id + k)
+        columns["type_id"].append(type_id)
+        columns["location_id"].append(station_id)
+        columns["system_id"].append(system_of[station_id])
+        columns["price"].append(round(base_price[type_id] * rng.uniform(0.8, 1.2), 2))
+        volume = rng.randint(1, 5000)
+        columns["volume_remain"].append(volume)
+        columns["volume_total"].append(volume + rng.randint(0, 5000))
+        columns["min_volume"].append(1)
+        columns["is_buy_order"].append(rng.random() < 0.45)
+        columns["issued"].append(ISSUED - rng.randint(0, 90 * 86400))
+        columns["duration"].append(90)
+        columns["range"].append(rng.randrange(3))
+    return columns
+
+
+def write_workspace(cache_dir, universe, station_data, item_data, region_orders):
+    # Schreibt alle Caches so, wie main.py sie erwartet; Snapshots gelten als frisch
+    os.makedirs(cache_dir, exist_ok=True)
+    for filename, data in (("universe_sde_cache.json", universe), ("station_cache.json", station_data),
+                           ("item_cache.json", item_data)):
+        with open(os.path.join(cache_dir, filename), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    expires = time.time() + 10 ** 8
+    for region_id, columns in region_orders.items():
+        base = os.path.join(cache_dir, f"region_{region_id}_all")
+        write_orders(f"{base}.orders", columns)
+        with open(f"{base}.meta.json", "w", encoding="utf-8") as f:
+            json.dump({"expires": expires, "pages": [
+                {"etag": None, "expires": None, "count": len(columns["order_id"])}
+            ]}, f)
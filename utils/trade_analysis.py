@@ -0,0 +1,322 @@
+import heapq
+import math
+import threading
+
+from utils import metrics
+from utils.basket_optimizer import optimize_basket
+from utils.matching import match_ladder, match_ladders, upper_bound
+from utils.order_book import get_order_book
+
+MAX_CACHED_PAIRS = 256
+RANK_METRICS = ("total_profit", "profit_per_m3", "profit_per_jump")
+
+
+def get_region_id_by_system_name(universe_index, system_name):
+    resolved = universe_index.resolve(system_name)
+    if resolved is None:
+        print(f"❌ System '{system_name.strip()}' nicht gefunden.")
+        return None, None
+    system_id, record = resolved
+    return record["region_id"], system_id
+
+
+def build_market_data(source_book, dest_book, source_system_id, dest_system_id):
+    market = {}
+    source_types = source_book.get(source_system_id, {})
+    dest_types = dest_book.get(dest_system_id, {})
+
+    for type_id, source_sides in source_types.items():
+        dest_sides = dest_types.get(type_id)
+        if dest_sides is None:
+            continue
+        if not source_sides["sell"].prices or not dest_sides["buy"].prices:
+            continue
+        market[type_id] = {
+            "sell_orders": source_sides["sell"],
+            "buy_orders": dest_sides["buy"]
+        }
+
+    return market
+
+
+def _known_items(market, item_table):
+    # [(type_id, Volumen)] der Items, die in der Tabelle stehen; Volumen in einem Bulk-Lookup
+    type_ids = list(market)
+    return [(type_id, volume) for type_id, volume in zip(type_ids, item_table.gather_volumes(type_ids))
+            if not math.isnan(volume)]
+
+
+@metrics.timed("evaluate_market")
+def evaluate_market(market, item_table, cargo_capacity, budget):
+    candidates = _known_items(market, item_table)
+    results = match_ladders([(market[type_id]["sell_orders"], market[type_id]["buy_orders"], volume)
+                             for type_id, volume in candidates], cargo_capacity, budget)
+
+    profitable = []
+    for k, (type_id, volume_per_unit) in enumerate(candidates):
+        total_units = results["units"][k]
+        if total_units == 0:
+            continue
+        profitable.append(_item_result(item_table, type_id, volume_per_unit, total_units, results["profit"][k]))
+    return profitable
+
+
+def _item_result(item_table, type_id, volume_per_unit, total_units, total_profit):
+    return {
+        "item_id": str(type_id),
+        "name": item_table.name(type_id),
+        "unit_profit": total_profit / total_units,
+        "volume": volume_per_unit,
+        "units": total_units,
+        "total_profit": total_profit,
+        "profit_per_m3": total_profit / (volume_per_unit * total_units) if volume_per_unit else 0.0
+    }
+
+
+class TopK:
+    # Die besten k Einträge nach einer Metrik als Min-Heap. `order` legt bei Gleichstand die
+    # Reihenfolge fest (kleiner = früher), damit das Ergebnis dem der vollen Sortierung entspricht.
+    def __init__(self, k, metric="total_profit"):
+        if metric not in RANK_METRICS:
+            raise ValueError(f"Unbekannte Metrik: {metric} (erlaubt: {', '.join(RANK_METRICS)})")
+        self.k = k
+        self.metric = metric
+        self._heap = []
+
+    def __len__(self):
+        return len(self._heap)
+
+    def threshold(self):
+        # Wert, den ein neuer Eintrag mindestens erreichen muss
+        if self.k <= 0:
+            return math.inf
+        return self._heap[0][0] if len(self._heap) >= self.k else -math.inf
+
+    def offer(self, value, order, entry):
+        item = (value, -order, entry)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif self.k > 0 and item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def entries(self):
+        # (value, order, entry) roh, z.B. zum Zusammenführen mehrerer TopK aus Worker-Prozessen
+        return [(value, -neg_order, entry) for value, neg_order, entry in self._heap]
+
+    def merge(self, entries):
+        for value, order, entry in entries:
+            self.offer(value, order, entry)
+
+    def results(self):
+        return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
+def collect_top_k(top, market, item_table, cargo_capacity, budget, jumps=1, order_base=0, make_entry=None):
+    # Bewertet nur Items, deren Obergrenze den aktuell k-besten Eintrag noch schlagen kann.
+    # order_base + Position im Markt ergibt die Reihenfolge wie bei der seriellen Auswertung.
+    candidates = _known_items(market, item_table)
+    bounds = []
+    for position, (type_id, volume) in enumerate(candidates):
+        data = market[type_id]
+        bound = upper_bound(data["sell_orders"], data["buy_orders"], volume, cargo_capacity, budget, top.metric, jumps)
+        if bound > 0:
+            bounds.append((bound, position, type_id, volume))
+    bounds.sort(key=lambda b: (-b[0], b[1]))
+
+    evaluated = 0
+    for bound, position, type_id, volume in bounds:
+        if bound < top.threshold():
+            break
+        evaluated += 1
+        data = market[type_id]
+        units, profit, _, _ = match_ladder(data["sell_orders"], data["buy_orders"], volume, cargo_capacity, budget)
+        if units == 0:
+            continue
+        item = _item_result(item_table, type_id, volume, units, profit)
+        item["jumps"] = jumps
+        item["profit_per_jump"] = profit / jumps if jumps else profit
+        entry = make_entry(item) if make_entry else item
+        top.offer(item[top.metric], order_base + position, entry)
+    metrics.inc("topk_evaluated", evaluated)
+    metrics.inc("topk_pruned", len(candidates) - evaluated)
+    return top
+
+
+@metrics.timed("evaluate_market", mode="top_k")
+def top_opportunities(market, item_table, cargo_capacity, budget, k=10, metric="total_profit", jumps=1):
+    # Wie sorted(evaluate_market(...), key=metric, reverse=True)[:k], aber mit Abbruch per Obergrenze
+    return collect_top_k(TopK(k, metric), market, item_table, cargo_capacity, budget, jumps).results()
+
+
+def rank_opportunities(entries, k, metric="total_profit"):
+    # Für bereits bewertete Listen (z.B. aus dem OpportunityCache); stabil wie sorted()
+    if metric not in RANK_METRICS:
+        raise ValueError(f"Unbekannte Metrik: {metric} (erlaubt: {', '.join(RANK_METRICS)})")
+    return heapq.nlargest(k, entries, key=lambda entry: entry.get(metric, entry["total_profit"]))
+
+
+class OpportunityCache:
+    # Bewertete Items pro (Quellsystem, Zielsystem, Frachtraum, Budget). Über den Änderungsfeed
+    # der Orderbücher werden nur die betroffenen (System, Typ)-Einträge verworfen und beim
+    # nächsten Abruf neu bewertet. Jeder Eintrag merkt sich die beiden Leitern, aus denen er
+    # berechnet wurde, und gilt nur, solange der Markt genau diese Ladder-Objekte enthält; eine
+    # Bewertung, die während eines Updates mit den alten Leitern fertig wird, trifft so nie zu.
+    def __init__(self):
+        self._entries = {}
+        self._by_system = {}
+        self._lock = threading.Lock()
+
+    def _evict(self, key):
+        del self._entries[key]
+        for system_id in key[:2]:
+            self._by_system.get(system_id, set()).discard(key)
+
+    def on_book_update(self, update):
+        with self._lock:
+            if update.affected is None:
+                self._entries.clear()
+                self._by_system.clear()
+                return
+            for system_id, type_id in update.affected:
+                for key in self._by_system.get(system_id, ()):
+                    self._entries[key].pop(type_id, None)
+
+    def evaluate(self, market, item_table, source_system_id, dest_system_id, cargo_capacity, budget):
+        key = (source_system_id, dest_system_id, cargo_capacity, budget)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= MAX_CACHED_PAIRS:
+                    self._evict(next(iter(self._entries)))
+                entry = self._entries[key] = {}
+                self._by_system.setdefault(source_system_id, set()).add(key)
+                self._by_system.setdefault(dest_system_id, set()).add(key)
+            found = {}
+            missing = {}
+            for type_id, data in market.items():
+                cached = entry.get(type_id)
+                if cached is not None and cached[0] is data["sell_orders"] and cached[1] is data["buy_orders"]:
+                    found[type_id] = cached[2]
+                else:
+                    missing[type_id] = data
+        metrics.inc("opportunity_cache_hits", len(found))
+
+        if missing:
+            metrics.inc("opportunity_cache_misses", len(missing))
+            evaluated = {int(item["item_id"]): item for item in evaluate_market(missing, item_table, cargo_capacity, budget)}
+            with self._lock:
+                for type_id, data in missing.items():
+                    found[type_id] = evaluated.get(type_id)
+                    entry[type_id] = (data["sell_orders"], data["buy_orders"], found[type_id])
+        return [found[type_id] for type_id in market if found.get(type_id)]
+
+
+@metrics.timed("basket_optimizer")
+def build_basket(market, item_table, cargo_capacity, budget):
+    # Ein gemeinsamer Warenkorb, der sich Frachtraum und Budget über alle Items teilt
+    candidates = [
+        (type_id, market[type_id]["sell_orders"], market[type_id]["buy_orders"], volume)
+        for type_id, volume in _known_items(market, item_table)
+    ]
+    basket = optimize_basket(candidates, cargo_capacity, budget)
+    basket["items"] = [{
+        "item_id": str(entry["key"]),
+        "name": item_table.name(entry["key"]),
+        "volume": item_table.volume(entry["key"]),
+        "units": entry["units"],
+        "total_profit": entry["profit"],
+        "isk_spent": entry["isk_spent"],
+        "m3_used": entry["m3_used"]
+    } for entry in basket["items"]]
+    return basket
+
+
+def find_direct_market(universe_index, station_index, source_system, dest_system, refresh=True):
+    # Gibt (market, source_system_id, dest_system_id) zurück
+    source_region, source_system_id = get_region_id_by_system_name(universe_index, source_system)
+    dest_region, dest_system_id = get_region_id_by_system_name(universe_index, dest_system)
+    if source_region is None or dest_region is None:
+        return {}, source_system_id, dest_system_id
+
+    source_book = get_order_book(source_region, station_index, order_type="all", refresh=refresh)
+    dest_book = get_order_book(dest_region, station_index, order_type="all", refresh=refresh)
+    return build_market_data(source_book, dest_book, source_system_id, dest_system_id), source_system_id, dest_system_id
+
+
+def _evaluate(market, item_table, source_system_id, dest_system_id, cargo_capacity, budget, cache):
+    if cache is None:
+        return evaluate_market(market, item_table, cargo_capacity, budget)
+    return cache.evaluate(market, item_table, source_system_id, dest_system_id, cargo_capacity, budget)
+
+
+@metrics.timed("opportunity_analysis", kind="direct")
+def find_direct_opportunities(universe_index, item_table, station_index, source_system, dest_system, cargo_capacity,
+                              budget, refresh=True, cache=None):
+    market, source_system_id, dest_system_id = find_direct_market(
+        universe_index, station_index, source_system, dest_system, refresh=refresh
+    )
+    profitable = _evaluate(market, item_table, source_system_id, dest_system_id, cargo_capacity, budget, cache)
+    return sorted(profitable, key=lambda x: x["total_profit"], reverse=True)
+
+
+def route_opportunity(source_sys, dest_sys, item, jumps):
+    return {
+        "from": source_sys,
+        "to": dest_sys,
+        "item": item["name"],
+        "units": item["units"],
+        "volume": item["volume"],
+        "total_profit": item["total_profit"],
+        "unit_profit": item["unit_profit"],
+        "profit_per_m3": item["profit_per_m3"],
+        "jumps": jumps,
+        "profit_per_jump": item["total_profit"] / jumps if jumps else item["total_profit"]
+    }
+
+
+def pair_order(pair_index):
+    # Reihenfolge-Basis eines Routenpaars für TopK; die Position im Markt kommt hinzu
+    return pair_index << 32
+
+
+@metrics.timed("opportunity_analysis", kind="route")
+def analyze_route_trade_opportunities(route, universe_index, item_table, station_index, cargo_capacity, budget,
+                                      refresh=True, cache=None, top_k=None, metric="total_profit"):
+    # top_k: nur die besten top_k nach `metric`; ohne Cache wird per Obergrenze abgebrochen,
+    # statt jedes Item über die Leitern zu bewerten
+    opportunities = []
+    top = TopK(top_k, metric) if top_k is not None and cache is None else None
+    pair_index = 0
+    books = {}  # Orderbuch pro Region, einmal pro Aufruf statt einmal pro Paar geholt
+
+    def get_book_for_system(system_name):
+        region_id, system_id = get_region_id_by_system_name(universe_index, system_name)
+        if not region_id or not system_id:
+            return {}, system_id
+        if region_id not in books:
+            books[region_id] = get_order_book(region_id, station_index, order_type="all", refresh=refresh)
+        return books[region_id], system_id
+
+    for i in range(len(route) - 1):
+        source_sys = route[i]
+        source_book, source_sys_id = get_book_for_system(source_sys)
+        for j in range(i + 1, len(route)):
+            dest_sys = route[j]
+            dest_book, dest_sys_id = get_book_for_system(dest_sys)
+
+            market = build_market_data(source_book, dest_book, source_sys_id, dest_sys_id)
+
+            if top is not None:
+                collect_top_k(top, market, item_table, cargo_capacity, budget, jumps=j - i,
+                              order_base=pair_order(pair_index),
+                              make_entry=lambda item: route_opportunity(source_sys, dest_sys, item, item["jumps"]))
+            else:
+                for item in _evaluate(market, item_table, source_sys_id, dest_sys_id, cargo_capacity, budget, cache):
+                    opportunities.append(route_opportunity(source_sys, dest_sys, item, j - i))
+            pair_index += 1
+
+    if top is not None:
+        return top.results()
+    if top_k is not None:
+        return rank_opportunities(opportunities, top_k, metric)
+    return sorted(opportunities, key=lambda x: x["total_profit"], reverse=True)
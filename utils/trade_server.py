@@ -0,0 +1,248 @@
+import argparse
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from utils import metrics, static_data
+from utils.arbitrage_scanner import THE_FORGE, neighbouring_regions, scan_regions
+from utils.generate_market_cache import EMPIRE_REGIONS, cache_expires_at, refresh_regions
+from utils.jump_distances import MODES, load_distance_table
+from utils.order_book import get_order_book, subscribe
+from utils.routing import resolve_policy
+from utils.static_data import UNIVERSE_PATH
+from utils.trade_analysis import (
+    analyze_route_trade_opportunities,
+    build_basket,
+    find_direct_market,
+    find_direct_opportunities,
+    OpportunityCache,
+    rank_opportunities
+)
+
+HOST = "127.0.0.1"
+PORT = 8765
+MIN_REFRESH_INTERVAL = 30  # Sekunden zwischen zwei Aktualisierungsrunden
+DEFAULT_CARGO = 10000
+DEFAULT_BUDGET = 100000000
+DEFAULT_LIMIT = 10
+SCAN_MODES = ("highsec",)  # Sicherheitsmodi, deren Distanztabellen der Server beim Start lädt
+ENDPOINTS = ("/health", "/route", "/trade", "/scan", "/metrics")
+
+
+class TradeState:
+    # Alles, was eine Anfrage braucht, bleibt im Speicher; Orderbücher werden nur aus
+    # vorhandenen Snapshots gelesen, das Nachladen übernimmt der Hintergrund-Thread.
+    def __init__(self, universe_path=UNIVERSE_PATH, order_type="all", scan_modes=SCAN_MODES):
+        self.universe_path = universe_path
+        self.scan_modes = scan_modes
+        self.order_type = order_type
+        self.universe_index = static_data.universe_index(universe_path)
+        self.route_graph = static_data.route_graph(universe_path)
+        self.item_table = static_data.item_table()
+        self.station_index = static_data.station_index()
+        self.region_ids = sorted({
+            record["region_id"] for record in self.universe_index.systems.values()
+            if record["region"].lower() in EMPIRE_REGIONS
+        })
+        self.distance_tables = {}  # Modus -> Distanztabelle, in warm_up geladen
+        self.last_refresh = None
+        self.opportunities = OpportunityCache()
+        subscribe(self.opportunities.on_book_update)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def book(self, region_id):
+        return get_order_book(region_id, self.station_index, order_type=self.order_type, refresh=False)
+
+    def warm_up(self):
+        print(f"🔥 Lade Orderbücher für {len(self.region_ids)} Regionen in den Speicher...")
+        for region_id in self.region_ids:
+            self.book(region_id)
+        # Eine fehlende Distanztabelle wird hier einmal gebaut, nicht in einer /scan-Anfrage
+        for mode in self.scan_modes:
+            self.distance_tables[mode] = load_distance_table(self.universe_path, mode, route_graph=self.route_graph)
+
+    def refresh_due_regions(self):
+        now = time.time()
+        due = [r for r in self.region_ids if cache_expires_at(r, self.order_type) <= now]
+        if due:
+            refreshed = refresh_regions(due, order_type=self.order_type)
+            for region_id in refreshed:
+                self.book(region_id)
+            self.last_refresh = time.time()
+        return due
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_due_regions()
+            except Exception as e:
+                print(f"⚠️ Fehler bei der Hintergrund-Aktualisierung: {e}")
+            next_expiry = min((cache_expires_at(r, self.order_type) for r in self.region_ids), default=0)
+            self._stop.wait(max(MIN_REFRESH_INTERVAL, next_expiry - time.time()))
+
+    def start_refresher(self):
+        self._thread = threading.Thread(target=self._refresh_loop, name="market-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        now = time.time()
+        return {
+            "regions": {str(r): {"expires_in": round(cache_expires_at(r, self.order_type) - now)} for r in self.region_ids},
+            "last_refresh": self.last_refresh
+        }
+
+    def route(self, start, end, policy="highsec"):
+        route = self.route_graph.route(start, end, policy=resolve_policy(policy))
+        return {"route": route, "jumps": max(len(route) - 1, 0)}
+
+    def trade(self, start, end, cargo_capacity=DEFAULT_CARGO, budget=DEFAULT_BUDGET, policy="highsec",
+              limit=DEFAULT_LIMIT, multi_hop=False, basket=False, metric="total_profit"):
+        result = self.route(start, end, policy)
+        route = result["route"]
+        if not route:
+            result["opportunities"] = []
+            return result
+
+        # Direkt gibt es nur ein Paar, profit_per_jump sortiert dort wie total_profit
+        result["opportunities"] = rank_opportunities(find_direct_opportunities(
+            self.universe_index, self.item_table, self.station_index, route[0], route[-1],
+            cargo_capacity, budget, refresh=False, cache=self.opportunities
+        ), limit, metric)
+        if basket:
+            market, _, _ = find_direct_market(self.universe_index, self.station_index, route[0], route[-1],
+                                              refresh=False)
+            result["basket"] = build_basket(market, self.item_table, cargo_capacity, budget)
+        if multi_hop:
+            result["route_opportunities"] = analyze_route_trade_opportunities(
+                route, self.universe_index, self.item_table, self.station_index, cargo_capacity, budget,
+                refresh=False, cache=self.opportunities, top_k=limit, metric=metric
+            )
+        return result
+
+    def scan(self, region_ids=None, cargo_capacity=DEFAULT_CARGO, budget=DEFAULT_BUDGET, mode="highsec",
+             limit=DEFAULT_LIMIT):
+        # Nur Regionen, die der Hintergrund-Thread aktuell hält, und nur vorab geladene Distanztabellen
+        if mode not in self.distance_tables:
+            raise ValueError(f"Modus {mode} wird nicht gescannt (verfügbar: {', '.join(self.distance_tables)})")
+        if not region_ids:
+            region_ids = [THE_FORGE] + neighbouring_regions(self.route_graph, THE_FORGE)
+        warm = set(self.region_ids)
+        skipped = [r for r in region_ids if r not in warm]
+        region_ids = [r for r in region_ids if r in warm]
+        spreads = scan_regions(region_ids, self.station_index, self.item_table, cargo_capacity, budget,
+                               universe_path=self.universe_path, mode=mode, limit=limit, refresh=False,
+                               distance_table=self.distance_tables[mode])
+        return {"regions": region_ids, "skipped_regions": skipped, "spreads": spreads}
+
+
+def _path_label(path):
+    # Unbekannte Pfade zusammenfassen, damit die Zahl der Metrik-Labels begrenzt bleibt
+    return path if path in ENDPOINTS else "other"
+
+
+class TradeRequestHandler(BaseHTTPRequestHandler):
+    server_version = "EVERouter/1.0"
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        metrics.inc("http_responses", path=_path_label(urlparse(self.path).path), status=status)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        with metrics.timer("http_request", path=_path_label(url.path)):
+            self._handle(url)
+
+    def _handle(self, url):
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        state = self.server.state
+
+        try:
+            if url.path == "/metrics":
+                self._send(200, metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            elif url.path == "/health":
+                self._send_json(200, state.status())
+            elif url.path == "/route":
+                self._send_json(200, state.route(params["from"], params["to"], params.get("policy", "highsec")))
+            elif url.path == "/trade":
+                self._send_json(200, state.trade(
+                    params["from"], params["to"],
+                    cargo_capacity=float(params.get("cargo", DEFAULT_CARGO)),
+                    budget=float(params.get("budget", DEFAULT_BUDGET)),
+                    policy=params.get("policy", "highsec"),
+                    limit=int(params.get("limit", DEFAULT_LIMIT)),
+                    multi_hop=params.get("multi_hop", "0") in ("1", "true", "yes"),
+                    basket=params.get("basket", "0") in ("1", "true", "yes"),
+                    metric=params.get("metric", "total_profit")
+                ))
+            elif url.path == "/scan":
+                self._send_json(200, state.scan(
+                    [int(r) for r in params["regions"].split(",")] if params.get("regions") else None,
+                    cargo_capacity=float(params.get("cargo", DEFAULT_CARGO)),
+                    budget=float(params.get("budget", DEFAULT_BUDGET)),
+                    mode=params.get("mode", "highsec"),
+                    limit=int(params.get("limit", DEFAULT_LIMIT))
+                ))
+            else:
+                self._send_json(404, {"error": f"Unbekannter Pfad: {url.path}"})
+        except KeyError as e:
+            self._send_json(400, {"error": f"Parameter fehlt: {e.args[0]}"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            # Alles andere (z.B. ein eben ersetzter Snapshot) soll nicht den Handler-Thread beenden
+            metrics.inc("http_errors", path=_path_label(url.path), error=type(e).__name__)
+            print(f"❌ Fehler bei {url.path}: {type(e).__name__}: {e}")
+            try:
+                self._send_json(500, {"error": f"Interner Fehler: {type(e).__name__}"})
+            except OSError:
+                pass  # Verbindung schon weg oder Antwort bereits angefangen
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=HOST, port=PORT, universe_path=UNIVERSE_PATH, refresh=True, scan_modes=SCAN_MODES):
+    state = TradeState(universe_path, scan_modes=scan_modes)
+    if refresh:
+        state.refresh_due_regions()
+    state.warm_up()
+    if refresh:
+        state.start_refresher()
+
+    server = ThreadingHTTPServer((host, port), TradeRequestHandler)
+    server.state = state
+    print(f"🛰️ Trade-Server läuft auf http://{host}:{server.server_address[1]} (/route, /trade, /scan, /health, /metrics)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Beende Trade-Server...")
+    finally:
+        state.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EVE Handelsrouten-Planer als lokaler JSON-Dienst")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--no-refresh", action="store_true", help="Marktdaten nicht im Hintergrund aktualisieren")
+    parser.add_argument("--quiet", action="store_true", help="Fortschrittsmeldungen unterdrücken")
+    parser.add_argument("--scan-modes", nargs="*", choices=sorted(MODES), default=list(SCAN_MODES),
+                        help="Sicherheitsmodi, die /scan anbietet (Distanztabellen werden beim Start geladen)")
+    args = parser.parse_args()
+    if args.quiet:
+        metrics.set_quiet()
+    serve(args.host, args.port, refresh=not args.no_refresh, scan_modes=tuple(args.scan_modes))
@@ -0,0 +1,101 @@
+import json
+import os
+from bisect import bisect_left
+from difflib import get_close_matches
+
+from utils import metrics
+
+INDEX_FILENAME = "universe_index.json"
+
+
+def build_universe_index(universe_data):
+    systems = {}
+    for region_name, region_data in universe_data.items():
+        for constellation_name, const_data in region_data["constellations"].items():
+            for sys_name, sys_data in const_data["systems"].items():
+                sys_id = sys_data.get("solarSystemID")
+                if sys_id is None:
+                    continue
+                systems[sys_id] = {
+                    "name": sys_name,
+                    "constellation": constellation_name,
+                    "constellation_id": const_data.get("constellation_id"),
+                    "region": region_name,
+                    "region_id": region_data.get("region_id")
+                }
+    return UniverseIndex(systems)
+
+
+class UniverseIndex:
+    def __init__(self, systems):
+        # solarSystemID -> {name, constellation, constellation_id, region, region_id}
+        self.systems = systems
+        self.by_name = {record["name"].lower(): sys_id for sys_id, record in systems.items()}
+        self.names = sorted(self.by_name)
+        self.by_region = {}
+        self.by_constellation = {}
+        for sys_id, record in systems.items():
+            self.by_region.setdefault(record["region_id"], []).append(sys_id)
+            self.by_constellation.setdefault(record["constellation_id"], []).append(sys_id)
+
+    def system_id(self, name):
+        return self.by_name.get(name.strip().lower())
+
+    def get(self, system_id):
+        return self.systems.get(system_id)
+
+    def resolve(self, name):
+        sys_id = self.system_id(name)
+        if sys_id is None:
+            return None
+        return sys_id, self.systems[sys_id]
+
+    def complete(self, prefix, limit=10):
+        prefix = prefix.strip().lower()
+        start = bisect_left(self.names, prefix)
+        matches = []
+        for name in self.names[start:]:
+            if not name.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(self.systems[self.by_name[name]]["name"])
+        return matches
+
+    def suggest(self, name, limit=5, cutoff=0.6):
+        name = name.strip().lower()
+        matches = self.complete(name, limit)
+        for close in get_close_matches(name, self.names, n=limit, cutoff=cutoff):
+            close_name = self.systems[self.by_name[close]]["name"]
+            if close_name not in matches:
+                matches.append(close_name)
+        return matches[:limit]
+
+    def to_json(self):
+        return {str(sys_id): record for sys_id, record in self.systems.items()}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls({int(sys_id): record for sys_id, record in data.items()})
+
+
+def index_path_for(universe_path):
+    return os.path.join(os.path.dirname(universe_path), INDEX_FILENAME)
+
+
+def load_universe_index(universe_path, universe_data=None, loader=None):
+    # loader(universe_path) liefert die Universumsdaten, falls der Index neu gebaut werden muss
+    index_path = index_path_for(universe_path)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(universe_path):
+        with open(index_path, "r", encoding="utf-8") as f, metrics.timer("cache_load", kind="universe_index"):
+            return UniverseIndex.from_json(json.load(f))
+
+    if universe_data is None and loader is not None:
+        universe_data = loader(universe_path)
+    if universe_data is None:
+        with open(universe_path, "r", encoding="utf-8") as f:
+            universe_data = json.load(f)
+
+    index = build_universe_index(universe_data)
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_json(), f, ensure_ascii=False)
+    print(f"💾 Namensindex für {len(index.systems)} Systeme gespeichert in {index_path}")
+    return index